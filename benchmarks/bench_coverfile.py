@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the .cover file parser in z3c.coverage.coverfile.
+
+Compares its throughput with that of the line-by-line loops that
+coveragereport and coveragediff used before.
+
+Usage: bench_coverfile.py [size-in-MB]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import z3c.coverage
+from z3c.coverage import coverfile
+
+
+def old_coveragereport_parse(filename):
+    """The former TraceCoverageNode._parse."""
+    covered = 0
+    total = 0
+    with open(filename) as file:
+        for line in file:
+            if line.startswith(' ' * 7) or len(line) < 7:
+                continue
+            total += 1
+            if not line.startswith('>>>>>>'):
+                covered += 1
+    return (covered, total)
+
+
+def old_coveragediff_count(filename):
+    """The former coveragediff.count_coverage."""
+    covered = uncovered = 0
+    with open(filename) as file:
+        for line in file:
+            if line.startswith('>>>>>>'):
+                uncovered += 1
+            elif len(line) >= 7 and not line.startswith(' ' * 7):
+                covered += 1
+    return covered, uncovered
+
+
+def make_input(filename, size):
+    """Write a .cover file of about ``size`` bytes from the sample input."""
+    sample_dir = os.path.join(os.path.dirname(z3c.coverage.__file__),
+                              'sampleinput')
+    sample = b''
+    for name in sorted(os.listdir(sample_dir)):
+        if name.endswith('.cover'):
+            with open(os.path.join(sample_dir, name), 'rb') as f:
+                sample += f.read()
+    with open(filename, 'wb') as f:
+        for i in range(max(1, size // len(sample))):
+            f.write(sample)
+
+
+def bench(name, function, filename, repeat=3):
+    """Run ``function(filename)`` and print the best throughput."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function(filename)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    size = os.path.getsize(filename) / (1024.0 * 1024.0)
+    print('%-32s %8.1f MB/s' % (name, size / max(best, 1e-9)))
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    size = int(args[0]) if args else 20
+    tmpdir = tempfile.mkdtemp(prefix='z3c.coverage-bench-')
+    try:
+        filename = os.path.join(tmpdir, 'big.cover')
+        make_input(filename, size * 1024 * 1024)
+        print('Parsing %.1f MB' % (os.path.getsize(filename) / 1048576.0))
+        bench('coveragereport loop (old)', old_coveragereport_parse,
+              filename)
+        bench('coveragediff loop (old)', old_coveragediff_count, filename)
+        coverfile.MMAP_THRESHOLD = os.path.getsize(filename) + 1
+        bench('coverfile.count_file', coverfile.count_file, filename)
+        bench('coverfile.parse_file', coverfile.parse_file, filename)
+        coverfile.MMAP_THRESHOLD = 0
+        bench('coverfile.count_file (mmap)', coverfile.count_file, filename)
+        bench('coverfile.parse_file (mmap)', coverfile.parse_file, filename)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for coveragereport and coveragediff on synthetic inputs.
+
+Generates a tree of Python modules, with directories of .cover files and
+coverage.py data files for two test runs of it, and measures the time and
+the peak memory use of
+
+- coveragereport.load_coverage,
+- coveragereport.generate_htmls_from_tree,
+- coveragereport.generate_overall_html_from_tree,
+- coveragediff.compare_dirs
+
+for both kinds of input.  The syntax highlighters are also compared with
+each other on a sample of the .cover files, one file at a time and, where
+a highlighter can do it, in one batch.
+
+The results can be saved as JSON, and compared with the results of another
+run, e.g. of another version:
+
+    bench_reports.py --modules=2000 --save=before.json
+    bench_reports.py --modules=2000 --compare=before.json
+
+Older versions of z3c.coverage work too: options they do not have (like
+--jobs and --highlighter) are ignored, and steps they cannot do (like
+comparing coverage.py data files) are skipped.
+
+Peak memory is measured with tracemalloc (Python 3 only), so it counts only
+the memory allocated by Python in the current process, and not that of
+worker processes with --jobs.  Tracing slows Python down a lot, so every
+step runs twice: once for timing, and once for measuring memory.
+"""
+from __future__ import print_function
+
+import inspect
+import json
+import optparse
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+try:
+    from shutil import which
+except ImportError:  # Python 2
+    from distutils.spawn import find_executable as which
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from coverage.data import CoverageData
+
+from z3c.coverage import coveragediff
+from z3c.coverage import coveragereport
+
+
+#: Version of the JSON results format.
+RESULTS_VERSION = 1
+
+
+def module_names(modules, depth, packages=4):
+    """Return ``modules`` dotted module names, nested ``depth`` levels deep.
+
+    The modules are spread over ``packages`` subpackages on every level.
+    """
+    names = []
+    for i in range(modules):
+        parts = ['pkg%d' % (i % packages)]
+        for level in range(1, depth):
+            parts.append('sub%d' % (i // packages ** level % packages))
+        parts.append('mod%d' % i)
+        names.append('.'.join(parts))
+    return names
+
+
+def module_source(lines):
+    """Return the source code of a module with about ``lines`` lines.
+
+    The module is a series of functions, whose bodies have a branch that
+    some test runs take and some do not.
+    """
+    source = ['"""Synthetic module."""', '']
+    n = 0
+    while len(source) < lines:
+        source.extend([
+            'def f%d(x):' % n,
+            '    # Comment',
+            '    if x:',
+            '        return x + %d' % n,
+            '    return None',
+            '',
+        ])
+        n += 1
+    return source
+
+
+def executed_lines(source, seed):
+    """Return the numbers of the executed lines of a module.
+
+    Whether the branches of a function were taken is decided randomly, but
+    the same ``seed`` gives the same result.
+    """
+    rng = random.Random(seed)
+    executed = [1]
+    for lineno, line in enumerate(source, 1):
+        if line.startswith('def '):
+            executed.append(lineno)
+            if rng.random() < 0.8:
+                executed.extend([lineno + 2, lineno + 4])
+                if rng.random() < 0.7:
+                    executed.append(lineno + 3)
+    return set(executed)
+
+
+def cover_text(source, executed):
+    """Format a module in the .cover file format of trace.py."""
+    result = []
+    for lineno, line in enumerate(source, 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            prefix = ' ' * 7
+        elif lineno in executed:
+            prefix = '%5d: ' % (lineno % 7 + 1)
+        else:
+            prefix = '>>>>>> '
+        result.append(prefix + line + '\n')
+    return ''.join(result)
+
+
+def make_inputs(root, modules, depth, lines, runs=2):
+    """Generate the synthetic inputs in the directory ``root``.
+
+    Writes the modules to ``root``/src, and for every test run a directory
+    of .cover files (``root``/cover0, cover1, ...) and a coverage.py data
+    file (``root``/coverage0, coverage1, ...).  The test runs execute
+    slightly different lines.
+
+    Returns a list of (cover_dir, data_file) tuples, one for every run.
+    """
+    src = os.path.join(root, 'src')
+    source = module_source(lines)
+    names = module_names(modules, depth)
+    inputs = [(os.path.join(root, 'cover%d' % run),
+               os.path.join(root, 'coverage%d' % run))
+              for run in range(runs)]
+    for cover_dir, data_file in inputs:
+        os.mkdir(cover_dir)
+    data = [{} for run in range(runs)]
+    for i, name in enumerate(names):
+        filename = os.path.join(src, *name.split('.')) + '.py'
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(filename, 'w') as f:
+            f.write('\n'.join(source) + '\n')
+        for run, (cover_dir, data_file) in enumerate(inputs):
+            # Every run executes the same lines of most modules.
+            seed = name if i % 10 else '%s.%d' % (name, run)
+            executed = executed_lines(source, seed)
+            with open(os.path.join(cover_dir, name + '.cover'), 'w') as f:
+                f.write(cover_text(source, executed))
+            data[run][filename] = sorted(executed)
+    for (cover_dir, data_file), lines_by_file in zip(inputs, data):
+        coverage_data = CoverageData()
+        coverage_data.add_lines(lines_by_file)
+        coverage_data.write_file(data_file)
+    return inputs
+
+
+class Options(object):
+    """The options that coveragereport.load_coverage needs."""
+
+    path_alias = None
+
+    def __init__(self, strip_prefix, jobs=1):
+        self.strip_prefix = strip_prefix
+        self.jobs = jobs
+
+
+def measure(function, setup, repeat=3):
+    """Call a function, and measure its time and peak memory use.
+
+    The function is called ``repeat`` times without memory tracing, for the
+    best time, and once more with tracing, for the memory.  ``setup``
+    returns the arguments for every call, as an (args, kw) tuple, so that
+    the calls do not reuse the lazily computed attributes of coverage trees.
+
+    Returns a (result, measurement) tuple, where ``measurement`` is a dict
+    with the wall clock time in ``seconds``, and the peak memory allocated
+    during the call in ``peak_memory`` (in bytes, or None without
+    tracemalloc).
+    """
+    elapsed = None
+    for i in range(repeat):
+        args, kw = setup()
+        start = time.time()
+        result = function(*args, **kw)
+        if elapsed is None or time.time() - start < elapsed:
+            elapsed = time.time() - start
+    peak = None
+    if tracemalloc is not None:
+        args, kw = setup()
+        tracemalloc.start()
+        try:
+            function(*args, **kw)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {'seconds': elapsed, 'peak_memory': peak}
+
+
+def accepts(function, argument):
+    """Tell whether a function has an argument, which older versions lack."""
+    getargspec = getattr(inspect, 'getfullargspec', None)
+    if getargspec is None:  # Python 2
+        getargspec = inspect.getargspec
+    return argument in getargspec(function).args
+
+
+def run_benchmarks(inputs, tmpdir, jobs=1, highlighter='python', repeat=3):
+    """Run all the benchmarks on the inputs from ``make_inputs(tmpdir)``.
+
+    Returns a dict of measurements (see ``measure``) by step name.  Steps
+    that the installed version of z3c.coverage cannot do are left out.
+    """
+    if hasattr(coveragereport, 'HIGHLIGHTER'):
+        coveragereport.HIGHLIGHTER = highlighter
+    src = os.path.join(tmpdir, 'src')
+    opts = Options(src, jobs)
+    html_kw = {}
+    if accepts(coveragereport.generate_htmls_from_tree, 'jobs'):
+        html_kw['jobs'] = jobs
+    diff_kw = {}
+    if accepts(coveragediff.compare_dirs, 'jobs'):
+        diff_kw['jobs'] = jobs
+    # Older versions only compare directories of .cover files.
+    diff_data = accepts(coveragediff.compare_dirs, 'strip_prefix')
+    results = {}
+    (old_dir, old_data), (new_dir, new_data) = inputs[:2]
+    for kind, path, old_path in [('cover', new_dir, old_dir),
+                                 ('coverage', new_data, old_data)]:
+        report_path = os.path.join(tmpdir, 'report-' + kind)
+        os.mkdir(report_path)
+        if hasattr(coveragereport, 'write_stylesheet'):
+            coveragereport.write_stylesheet(report_path)
+
+        def load():
+            return coveragereport.load_coverage(path, opts)
+        results['%s/load_coverage' % kind] = measure(
+            coveragereport.load_coverage, lambda: ((path, opts), {}),
+            repeat)[1]
+        results['%s/generate_htmls_from_tree' % kind] = measure(
+            coveragereport.generate_htmls_from_tree,
+            lambda: ((load(), path, report_path), html_kw), repeat)[1]
+        results['%s/generate_overall_html_from_tree' % kind] = measure(
+            coveragereport.generate_overall_html_from_tree,
+            lambda: ((load(), os.path.join(report_path, 'all.html')), {}),
+            repeat)[1]
+        if kind == 'coverage' and not diff_data:
+            continue
+        warnings = set()
+
+        def warn(filename, message):
+            warnings.add((filename, message))
+        kw = dict(diff_kw, warn=warn)
+        if diff_data:
+            kw['strip_prefix'] = src
+        results['%s/compare_dirs' % kind] = measure(
+            coveragediff.compare_dirs, lambda: ((old_path, path), kw),
+            repeat)[1]
+        results['%s/compare_dirs' % kind]['warnings'] = len(warnings)
+    return results
+
+
+def highlighter_benchmarks(cover_dir, files=50, repeat=3):
+    """Compare the syntax highlighters on a sample of .cover files.
+
+    Every highlighter highlights the first ``files`` files of ``cover_dir``
+    one at a time, and also in one batch if it has a batch version.
+    enscript is left out if it is not installed, because it would fall back
+    to no highlighting at all.
+
+    Returns a dict of measurements (see ``measure``) by step name, which
+    also have the number of ``files``.
+    """
+    highlighters = getattr(coveragereport, 'HIGHLIGHTERS', {})
+    batch_highlighters = getattr(coveragereport, 'BATCH_HIGHLIGHTERS', {})
+    texts = []
+    for filename in sorted(os.listdir(cover_dir))[:files]:
+        with open(os.path.join(cover_dir, filename)) as f:
+            texts.append(f.read())
+    results = {}
+    for name in sorted(highlighters):
+        if name == 'enscript' and not which(
+                coveragereport.HIGHLIGHT_COMMAND[0]):
+            continue
+        highlight = highlighters[name]
+        results['highlight/%s' % name] = measure(
+            lambda: [highlight(text) for text in texts],
+            lambda: ((), {}), repeat)[1]
+        if name in batch_highlighters:
+            results['highlight/%s-batch' % name] = measure(
+                batch_highlighters[name], lambda: ((texts, ), {}),
+                repeat)[1]
+    for result in results.values():
+        result['files'] = len(texts)
+    return results
+
+
+def format_size(size):
+    """Format a number of bytes for humans."""
+    if size is None:
+        return '-'
+    return '%.1f MB' % (size / (1024.0 * 1024.0))
+
+
+def print_results(results, baseline=None):
+    """Print the results, and how they changed since ``baseline``."""
+    for step in sorted(results):
+        result = results[step]
+        line = '%-44s %8.3f s %10s' % (step, result['seconds'],
+                                      format_size(result['peak_memory']))
+        if result.get('files'):
+            line += '  %6.1f ms/file' % (
+                1000.0 * result['seconds'] / result['files'])
+        old = (baseline or {}).get(step)
+        if old:
+            line += '  time %+6.1f%%' % (
+                100.0 * (result['seconds'] / max(old['seconds'], 1e-9) - 1))
+            if result['peak_memory'] and old.get('peak_memory'):
+                line += '  memory %+6.1f%%' % (
+                    100.0 * (float(result['peak_memory']) /
+                             old['peak_memory'] - 1))
+        print(line)
+
+
+def parameters(opts):
+    """The parameters of a run, which should match for comparing runs."""
+    return {'modules': opts.modules, 'depth': opts.depth,
+            'lines': opts.lines, 'jobs': opts.jobs,
+            'highlighter': opts.highlighter,
+            'highlight_files': opts.highlight_files}
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        'usage: %prog [options]',
+        description='Measures the time and memory that coveragereport and'
+                    ' coveragediff take for synthetic inputs.')
+    parser.add_option('--modules', type='int', default=500,
+                      help='number of modules (default: %default)')
+    parser.add_option('--depth', type='int', default=3,
+                      help='package nesting depth (default: %default)')
+    parser.add_option('--lines', type='int', default=300,
+                      help='lines per module (default: %default)')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of worker processes (default: %default)')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='take the best time of this many runs'
+                           ' (default: %default)')
+    # Older versions always highlight with enscript.
+    highlighters = sorted(getattr(coveragereport, 'HIGHLIGHTERS',
+                                  ['enscript']))
+    parser.add_option('--highlighter', choices=highlighters,
+                      default='python' if 'python' in highlighters
+                      else highlighters[0],
+                      help='syntax highlighter (default: %default)')
+    parser.add_option('--highlight-files', type='int', default=50,
+                      help='number of files to compare the syntax'
+                           ' highlighters on (default: %default)')
+    parser.add_option('--save', metavar='FILE',
+                      help='save the results to a JSON file')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare the results with a saved JSON file')
+    opts, args = parser.parse_args(args)
+    if args:
+        parser.error('no arguments expected')
+    baseline = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            parser.error('%s: unknown results format' % opts.compare)
+        if baseline['parameters'] != parameters(opts):
+            print('Warning: %s was made with different parameters: %s' % (
+                opts.compare, baseline['parameters']))
+    tmpdir = tempfile.mkdtemp(prefix='z3c.coverage-bench-')
+    try:
+        start = time.time()
+        inputs = make_inputs(tmpdir, opts.modules, opts.depth, opts.lines)
+        print('Generated %d modules of %d lines in %.1f s' % (
+            opts.modules, opts.lines, time.time() - start))
+        results = run_benchmarks(inputs, tmpdir, opts.jobs, opts.highlighter,
+                                 opts.repeat)
+        results.update(highlighter_benchmarks(
+            inputs[1][0], opts.highlight_files, opts.repeat))
+    finally:
+        shutil.rmtree(tmpdir)
+    print_results(results, baseline and baseline['results'])
+    if opts.save:
+        with open(opts.save, 'w') as f:
+            json.dump({'version': RESULTS_VERSION,
+                       'parameters': parameters(opts),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                             time.gmtime()),
+                       'results': results},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -20,20 +20,52 @@ old lines of code that used to have tests but don't any more).
 Usage: coveragediff.py [options] old-dir new-dir
 
 The directories are expected to contain files named '<package>.<module>.cover'
-with the format that Python's trace.py produces.
+with the format that Python's trace.py produces.  Either of them can also be
+a data file that coverage.py produces (usually called .coverage), or a
+baseline file written by coveragediff --save-baseline.  Glob patterns that
+match several directories or data files, e.g. from parallel test runs, merge
+their coverage.
 """
 from __future__ import print_function
 
+import base64
+import bisect
+import fnmatch
+import glob
+import gzip
+import heapq
+import itertools
+import json
 import os
 import re
 import smtplib
+import struct
 import optparse
+import multiprocessing
+import multiprocessing.pool
+import zlib
 
 try:
     from email.MIMEText import MIMEText
 except ImportError:  # pragma: nocover
     from email.mime.text import MIMEText
 
+try:
+    from z3c.coverage import coverfile
+except ImportError:  # pragma: nocover
+    # Running as a script next to coverfile.py
+    import coverfile
+
+
+#: Maximum number of newly untested lines listed for every module.
+MAX_SNIPPETS = 10
+
+#: Format name in baseline files.
+BASELINE_FORMAT = 'z3c.coverage baseline'
+
+#: Version of the format of baseline files.
+BASELINE_VERSION = 1
+
 
 def matches(string, list_of_regexes):
     """Check whether a string matches any of a list of regexes.
@@ -115,30 +147,380 @@ def warn(filename, message):
     print('{}: {}'.format(module, message))
 
 
-def compare_dirs(olddir, newdir, include=(), exclude=(), warn=warn):
-    """Compare two directories of coverage files."""
-    old_coverage_files = filter_coverage_files(olddir, include, exclude)
-    new_coverage_files = filter_coverage_files(newdir, include, exclude)
+def compare_dirs(olddir, newdir, include=(), exclude=(), warn=warn,
+                 strip_prefix=None, path_aliases=None, lines=False, jobs=1):
+    """Compare two directories of coverage files.
+
+    Either of them can also be a coverage.py data file (see
+    ``find_coverage``).
+
+    With ``lines``, modules that are in both are compared line by line (see
+    ``compare_lines``).
+
+    If ``jobs`` is greater than 1, that many modules are compared
+    concurrently by a pool of worker processes, or of threads if there is
+    coverage.py data or a baseline, which are already in memory.  The
+    warnings are the same either way, in the same order.
+    """
+    old_coverage = find_coverage(olddir, include, exclude, strip_prefix,
+                                 path_aliases, jobs=jobs)
+    new_coverage = find_coverage(newdir, include, exclude, strip_prefix,
+                                 path_aliases, jobs=jobs)
+
+    pairs = [(old_coverage.get(fn), new_coverage[fn], lines)
+             for fn in sorted(new_coverage)]
+    processes = not any(isinstance(coverage, ModuleCoverage)
+                        for coverage in list(old_coverage.values()) +
+                        list(new_coverage.values()))
+    for warnings in map_jobs(_compare_pair_job, pairs, jobs, processes):
+        for filename, message in warnings:
+            warn(filename, message)
+
+
+def map_jobs(function, items, jobs=1, processes=True):
+    """Call a function for every item of a list, in ``jobs`` workers.
+
+    The workers are processes, or threads if ``processes`` is false.
+
+    Yields the results in the order of the items.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    if processes:
+        pool = multiprocessing.Pool(jobs)
+    else:
+        pool = multiprocessing.pool.ThreadPool(jobs)
+    try:
+        # imap() returns the results in order, as soon as they are ready.
+        for result in pool.imap(function, items,
+                                chunksize=max(1, len(items) // (jobs * 16))):
+            yield result
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def compare_pair(pair, warn=warn):
+    """Compare the coverage of a module in two directories.
+
+    ``pair`` is a tuple (oldfile, newfile, lines), where ``oldfile`` is None
+    for new modules.
+    """
+    oldfile, newfile, lines = pair
+    if oldfile is None:
+        new_file(newfile, warn=warn)
+    elif lines:
+        compare_lines(oldfile, newfile, warn=warn)
+    else:
+        compare_file(oldfile, newfile, warn=warn)
+
+
+def _compare_pair_job(pair):
+    """Compare the coverage of a module, and return the warnings."""
+    warnings = []
+    compare_pair(pair, warn=lambda *args: warnings.append(args))
+    return warnings
+
+
+def find_coverage(path, include=(), exclude=(), strip_prefix=None,
+                  path_aliases=None, jobs=1):
+    """Find the coverage of the modules in a directory or coverage.py data.
+
+    Returns a dict that maps the name of a coverage file to the pathname of
+    the file, if ``path`` is a directory.  Otherwise ``path`` is a baseline
+    file or a coverage.py data file, and the dict maps the name that the
+    coverage file of every module would have to a ``ModuleCoverage``.
+
+    ``path`` can also be a glob pattern.  If it matches several directories,
+    the coverage files of the same name in them are merged, and the dict
+    maps their name to ``MergedCoverageFiles``.  If it matches several
+    coverage.py data files, their data is merged.
+    """
+    paths = sorted(glob.glob(path)) or [path]
+    if len(paths) > 1 and all(os.path.isdir(path) for path in paths):
+        return merge_coverage_dirs(paths, include, exclude)
+    if len(paths) > 1:
+        if any(os.path.isdir(path) or is_baseline(path) for path in paths):
+            raise ValueError('%s matches files that cannot be merged'
+                             % path)
+        coverage = load_coverage_data(paths, strip_prefix, path_aliases,
+                                      jobs=jobs)
+        return dict((fn, coverage[fn])
+                    for fn in filter_files(coverage, include, exclude))
+    path = paths[0]
+    if os.path.isdir(path):
+        return dict((fn, os.path.join(path, fn))
+                    for fn in filter_coverage_files(path, include, exclude))
+    if is_baseline(path):
+        coverage = load_baseline(path)
+    else:
+        coverage = load_coverage_data(path, strip_prefix, path_aliases,
+                                      jobs=jobs)
+    return dict((fn, coverage[fn])
+                for fn in filter_files(coverage, include, exclude))
 
-    old_coverage_set = set(old_coverage_files)
-    for fn in sorted(new_coverage_files):
-        if fn in old_coverage_set:
-            compare_file(os.path.join(olddir, fn),
-                         os.path.join(newdir, fn), warn=warn)
+
+def merge_coverage_dirs(dirs, include=(), exclude=()):
+    """Find the coverage files in several directories, and group them.
+
+    Returns a dict that maps the name of a coverage file to the pathname of
+    the file, if only one of the directories has it, or else to
+    ``MergedCoverageFiles`` with the pathnames of all of them.
+    """
+    # A k-way merge of the sorted file lists brings files with the same
+    # name together.
+    listings = [[(fn, os.path.join(dir, fn))
+                 for fn in sorted(filter_coverage_files(dir, include,
+                                                        exclude))]
+                for dir in dirs]
+    result = {}
+    for fn, group in itertools.groupby(heapq.merge(*listings),
+                                       key=lambda item: item[0]):
+        filenames = [filename for fn, filename in group]
+        if len(filenames) == 1:
+            result[fn] = filenames[0]
         else:
-            new_file(os.path.join(newdir, fn), warn=warn)
+            result[fn] = MergedCoverageFiles(filenames)
+    return result
+
+
+class MergedCoverageFiles(tuple):
+    """The pathnames of several coverage files of the same module.
+
+    Takes the place of the pathname of a coverage file; the files are
+    merged when they are read (see ``coverfile.merge_lines``).
+    """
+
+    def __str__(self):
+        return self[0]
+
+    def read(self):
+        """Return the contents of the merged coverage file, as bytes."""
+        return coverfile.merge_files(self)
+
+
+class ModuleCoverage(tuple):
+    """The (covered, uncovered) counts of a module in coverage.py data.
+
+    Takes the place of the pathname of a coverage file, so its string
+    form is the name of the module:
+
+        >>> coverage = ModuleCoverage('z3c.coverage.coveragediff', 3, 1)
+        >>> print(coverage)
+        z3c.coverage.coveragediff
+        >>> covered, uncovered = coverage
+        >>> covered, uncovered
+        (3, 1)
+
+    """
+
+    def __new__(cls, name, covered, uncovered, node=None):
+        self = tuple.__new__(cls, (covered, uncovered))
+        self.name = name
+        # The coveragereport tree node, for the annotated source code
+        self.node = node
+        return self
+
+    def __str__(self):
+        return self.name
+
+
+def load_coverage_data(filename, strip_prefix=None, path_aliases=None,
+                       jobs=1):
+    """Count covered and uncovered lines in a coverage.py data file.
+
+    ``filename`` can also be a list of data files, which are merged.
+
+    The source files are analyzed like in coveragereport, so they must be
+    available.  ``strip_prefix``, ``path_aliases`` and ``jobs`` are the same
+    as its --strip-prefix, --path-alias and --jobs options.
+
+    Returns a dict mapping '<package>.<module>.cover' to a
+    ``ModuleCoverage``.
+    """
+    try:
+        from z3c.coverage import coveragereport
+    except ImportError:  # pragma: nocover
+        # Running as a script next to coveragereport.py
+        import coveragereport
+    if isinstance(filename, (list, tuple)):
+        data_files = list(filename)
+    else:
+        data_files = [filename]
+    cov = coveragereport.merge_coverage_data(data_files)
+    tree = coveragereport.create_tree_from_coverage(
+        cov, strip_prefix=strip_prefix, path_aliases=path_aliases, jobs=jobs,
+        data_files=data_files)
+    result = {}
+
+    def add_module(node, index):
+        if not node:
+            name = coveragereport.index_to_name(index)
+            result[name + '.cover'] = ModuleCoverage(name, node.covered,
+                                                     node.uncovered, node)
+
+    coveragereport.traverse_tree(tree, [], add_module)
+    return result
+
+
+class BaselineCoverage(ModuleCoverage):
+    """The coverage of a module in a baseline file.
+
+    ``entry`` is the record of the module in the file (see
+    ``baseline_entry``).
+    """
+
+    def __new__(cls, name, entry):
+        self = ModuleCoverage.__new__(cls, name, entry['covered'],
+                                      entry['uncovered'])
+        self.entry = entry
+        return self
+
+    def get_lines(self):
+        """Return the (status, hits) of every line, like ``parse_lines``.
+
+        The number of times a line was executed is not known.
+        """
+        count = self.entry['lines']
+        covered = (coverfile.COVERED, None)
+        missing = (coverfile.MISSING, 0)
+        not_code = (coverfile.NOT_CODE, None)
+        return [(missing if is_missing else covered) if is_code else not_code
+                for is_code, is_missing in zip(
+                    unpack_bits(self.entry['code'], count),
+                    unpack_bits(self.entry['missing'], count))]
+
+    def get_hashes(self):
+        """Return the hashes of the source code of every line."""
+        data = base64.b64decode(self.entry['hashes'])
+        return list(struct.unpack('<%dI' % (len(data) // 4), data))
+
+
+def baseline_entry(filename):
+    """Describe the coverage of a module for a baseline file.
+
+    ``filename`` is the name of a coverage file, or a ``ModuleCoverage``.
+
+    Returns a dict with the number of covered and uncovered lines, the
+    number of lines, bitmaps of the lines that are code and that are not
+    covered, and a hash of the source code of every line (see
+    ``hash_line``).  The bitmaps and hashes are encoded with base64.
+    """
+    lines, source = read_coverage_lines(filename)
+    return {
+        'covered': sum(1 for status, hits in lines
+                       if status == coverfile.COVERED),
+        'uncovered': sum(1 for status, hits in lines
+                         if status == coverfile.MISSING),
+        'lines': len(lines),
+        'code': pack_bits([status != coverfile.NOT_CODE
+                           for status, hits in lines]),
+        'missing': pack_bits([status == coverfile.MISSING
+                              for status, hits in lines]),
+        'hashes': base64.b64encode(
+            struct.pack('<%dI' % len(lines),
+                        *line_hashes(filename, source))).decode('ascii'),
+    }
+
+
+def write_baseline(path, filename, include=(), exclude=(), strip_prefix=None,
+                   path_aliases=None, jobs=1):
+    """Write a baseline file with the coverage of the modules in ``path``.
+
+    ``path`` can be anything that ``compare_dirs`` accepts, and the
+    baseline file can take its place later.  It is a gzip-compressed JSON
+    file with the coverage of every module (see ``baseline_entry``), much
+    smaller than a directory of coverage files, and faster to load.
+    """
+    coverage = find_coverage(path, include, exclude, strip_prefix,
+                             path_aliases, jobs=jobs)
+    names = sorted(coverage)
+    entries = map_jobs(baseline_entry, [coverage[fn] for fn in names], jobs,
+                       processes=os.path.isdir(path))
+    baseline = {'format': BASELINE_FORMAT, 'version': BASELINE_VERSION,
+                'modules': dict(zip(names, entries))}
+    data = json.dumps(baseline, sort_keys=True, separators=(',', ':'))
+    with open(filename, 'wb') as file:
+        with gzip.GzipFile('', 'wb', 9, file, mtime=0) as gzfile:
+            gzfile.write(data.encode('ascii'))
+
+
+def is_baseline(filename):
+    """Check whether a file is a baseline file (and not coverage.py data)."""
+    with open(filename, 'rb') as file:
+        return file.read(2) == b'\x1f\x8b'  # gzip-compressed
+
+
+def load_baseline(filename):
+    """Load a baseline file.
+
+    Returns a dict mapping '<package>.<module>.cover' to a
+    ``BaselineCoverage``.
+    """
+    with gzip.open(filename, 'rb') as file:
+        baseline = json.loads(file.read().decode('ascii'))
+    if (baseline.get('format') != BASELINE_FORMAT or
+            baseline.get('version') != BASELINE_VERSION):
+        raise ValueError('%s is not a baseline file of version %d'
+                         % (filename, BASELINE_VERSION))
+    return dict((fn, BaselineCoverage(strip(fn, '.cover'), entry))
+                for fn, entry in baseline['modules'].items())
+
+
+def pack_bits(flags):
+    """Encode a list of booleans as a bitmap in base64.
+
+        >>> pack_bits([True, False, False, True, True])
+        'GQ=='
+        >>> unpack_bits('GQ==', 5)
+        [True, False, False, True, True]
+
+    """
+    bits = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def unpack_bits(text, count):
+    """Decode a bitmap of ``count`` booleans in base64."""
+    bits = bytearray(base64.b64decode(text))
+    return [bool(bits[i >> 3] & (1 << (i & 7))) for i in range(count)]
+
+
+def hash_line(line):
+    """Hash the source code of a line (bytes) for a baseline file."""
+    return zlib.crc32(line) & 0xffffffff
+
+
+def line_hashes(filename, source):
+    """Return the hashes of the source code of the lines of a module.
+
+    ``source`` is the source code returned by ``read_coverage_lines``.
+    """
+    if isinstance(filename, BaselineCoverage):
+        return filename.get_hashes()
+    return [hash_line(line) for line in source]
 
 
 def count_coverage(filename):
-    """Count the number of covered and uncovered lines in a file."""
-    covered = uncovered = 0
-    with open(filename) as file:
-        for line in file:
-            if line.startswith('>>>>>>'):
-                uncovered += 1
-            elif len(line) >= 7 and not line.startswith(' ' * 7):
-                covered += 1
-    return covered, uncovered
+    """Count the number of covered and uncovered lines in a file.
+
+    ``filename`` can also be a ``ModuleCoverage``, which is already
+    counted, or ``MergedCoverageFiles``.
+    """
+    if isinstance(filename, ModuleCoverage):
+        return filename
+    if isinstance(filename, MergedCoverageFiles):
+        return coverfile.count_coverage(filename.read())
+    return coverfile.count_file(filename)
 
 
 def compare_file(oldfile, newfile, warn=warn):
@@ -147,7 +529,164 @@ def compare_file(oldfile, newfile, warn=warn):
     new_covered, new_uncovered = count_coverage(newfile)
     if new_uncovered > old_uncovered:
         increase = new_uncovered - old_uncovered
-        warn(newfile, "%d new lines of untested code" % increase)
+        warn(str(newfile), "%d new lines of untested code" % increase)
+
+
+def compare_lines(oldfile, newfile, warn=warn):
+    """Compare two coverage files line by line.
+
+    The lines of the two files are matched by their source code (see
+    ``align_lines``), and the untested lines of the new file are reported
+    unless they match untested lines of the old file.  So a line that
+    loses its test is found even if another line gets tested in return.
+    """
+    old_lines, old_source = read_coverage_lines(oldfile)
+    new_lines, new_source = read_coverage_lines(newfile)
+    if old_source is None or new_source is None:
+        # Baselines have only hashes of the source code.
+        old_index = dict((j, i) for i, j in align_lines(
+            line_hashes(oldfile, old_source),
+            line_hashes(newfile, new_source)))
+    else:
+        old_index = dict((j, i)
+                         for i, j in align_lines(old_source, new_source))
+    untested = [j for j, (status, hits) in enumerate(new_lines)
+                if status == coverfile.MISSING and
+                (j not in old_index or
+                 old_lines[old_index[j]][0] != coverfile.MISSING)]
+    if untested:
+        msg = ["%d new lines of untested code" % len(untested)]
+        for j in untested[:MAX_SNIPPETS]:
+            if new_source is None:
+                msg.append("    %5d" % (j + 1))
+                continue
+            source = new_source[j].decode('utf-8', 'replace').rstrip()
+            msg.append("    %5d: %s" % (j + 1, source))
+        if len(untested) > MAX_SNIPPETS:
+            msg.append("    ... and %d more" % (len(untested) - MAX_SNIPPETS))
+        warn(str(newfile), '\n'.join(msg))
+
+
+def read_coverage_lines(filename):
+    """Read the lines of a coverage file.
+
+    ``filename`` can also be a ``ModuleCoverage`` or
+    ``MergedCoverageFiles``.
+
+    Returns a list with the (status, hits) of every line, like
+    ``coverfile.parse_lines``, and a list with the source code of every
+    line, as bytes.  Baselines have no source code, so it is None for them.
+    """
+    if isinstance(filename, BaselineCoverage):
+        return filename.get_lines(), None
+    if isinstance(filename, ModuleCoverage):
+        data = (filename.node.get_cover_text() or '').encode('utf-8')
+    elif isinstance(filename, MergedCoverageFiles):
+        data = filename.read()
+    else:
+        with open(filename, 'rb') as file:
+            data = file.read()
+    lines = coverfile.parse_lines(data)
+    # Skip the coverage prefix of every line
+    source = [line[7:] for line in data.split(b'\n', len(lines))]
+    return lines, source[:len(lines)]
+
+
+def align_lines(old, new):
+    """Match the equal lines of two sequences, like patience diff.
+
+    Lines that occur once in both sequences are matched first, where they
+    are in the same order, and the parts between them are matched the same
+    way, after matching the equal lines at their start and end:
+
+        >>> old = ['a', 'b', 'c', 'x', 'd', 'x']
+        >>> new = ['a', 'c', 'b', 'x', 'd', 'e', 'x']
+        >>> for i, j in align_lines(old, new):
+        ...     print(i, j, old[i])
+        0 0 a
+        2 1 c
+        3 3 x
+        4 4 d
+        5 6 x
+
+    This takes about linear time for files of source code, where most lines
+    are unique, unlike finding the longest common subsequence.
+
+    Returns a list of (old index, new index) pairs in order.
+    """
+    result = []
+    # Ranges of the two sequences that are left to match; there is no
+    # recursion because of the recursion limit.
+    stack = [(0, len(old), 0, len(new))]
+    while stack:
+        old_start, old_end, new_start, new_end = stack.pop()
+        while (old_start < old_end and new_start < new_end and
+               old[old_start] == new[new_start]):
+            result.append((old_start, new_start))
+            old_start += 1
+            new_start += 1
+        while (old_start < old_end and new_start < new_end and
+               old[old_end - 1] == new[new_end - 1]):
+            old_end -= 1
+            new_end -= 1
+            result.append((old_end, new_end))
+        if old_start == old_end or new_start == new_end:
+            continue
+        anchors = unique_common_lines(old, old_start, old_end,
+                                      new, new_start, new_end)
+        for i, j in anchors:
+            result.append((i, j))
+            stack.append((old_start, i, new_start, j))
+            old_start, new_start = i + 1, j + 1
+        if anchors:
+            stack.append((old_start, old_end, new_start, new_end))
+    result.sort()
+    return result
+
+
+def unique_common_lines(old, old_start, old_end, new, new_start, new_end):
+    """Find the longest run of unique lines in the same order in two ranges.
+
+    Returns a list of (old index, new index) pairs of lines that occur
+    exactly once in ``old[old_start:old_end]`` and ``new[new_start:new_end]``.
+
+        >>> unique_common_lines('abcd', 0, 4, 'bdac', 0, 4)
+        [(1, 0), (3, 1)]
+
+    """
+    counts = {}
+    for i in range(old_start, old_end):
+        line = old[i]
+        counts[line] = -1 if line in counts else i
+    new_index = {}
+    for j in range(new_start, new_end):
+        line = new[j]
+        if counts.get(line, -1) != -1:
+            new_index[line] = -1 if line in new_index else j
+    pairs = [(counts[line], j) for line, j in new_index.items() if j != -1]
+    pairs.sort()
+    # Patience sorting: piles[k] is the last pair of the best increasing
+    # run of length k + 1 found so far, and back links lead to the pairs
+    # before it.
+    tops = []
+    piles = []
+    back = {}
+    for pair in pairs:
+        k = bisect.bisect_left(tops, pair[1])
+        back[pair] = piles[k - 1] if k else None
+        if k == len(tops):
+            tops.append(pair[1])
+            piles.append(pair)
+        else:
+            tops[k] = pair[1]
+            piles[k] = pair
+    run = []
+    pair = piles[-1] if piles else None
+    while pair is not None:
+        run.append(pair)
+        pair = back[pair]
+    run.reverse()
+    return run
 
 
 def new_file(newfile, warn=warn):
@@ -157,7 +696,7 @@ def new_file(newfile, warn=warn):
         total = covered + uncovered
         msg = "new file with %d lines of untested code (out of %d)" % (
                     uncovered, total)
-        warn(newfile, msg)
+        warn(str(newfile), msg)
 
 
 def strip(string, suffix):
@@ -208,13 +747,31 @@ def urljoin(base, *suburls):
 
 
 class MailSender(object):
-    """Send emails over SMTP"""
+    """Send emails over SMTP
+
+    Every email is sent over a new connection, unless ``connect`` has been
+    called; then all emails are sent over the same connection, until
+    ``quit`` is called.
+    """
 
     connection_class = smtplib.SMTP
 
     def __init__(self, smtp_host='localhost', smtp_port=25):
         self.smtp_host = smtp_host
         self.smtp_port = smtp_port
+        self.connection = None
+
+    def connect(self):
+        """Open a connection for sending several emails."""
+        if self.connection is None:
+            self.connection = self.connection_class(self.smtp_host,
+                                                    self.smtp_port)
+
+    def quit(self):
+        """Close the connection opened by ``connect``."""
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            connection.quit()
 
     def send_email(self, from_addr, to_addr, subject, body):
         """Send an email."""
@@ -226,6 +783,9 @@ class MailSender(object):
         if to_addr:
             msg['To'] = to_addr
         msg['Subject'] = subject
+        if self.connection is not None:
+            self.connection.sendmail(from_addr, to_addr, msg.as_string())
+            return
         smtp = self.connection_class(self.smtp_host, self.smtp_port)
         smtp.sendmail(from_addr, to_addr, msg.as_string())
         smtp.quit()
@@ -248,10 +808,16 @@ class ReportPrinter(object):
 
 
 class ReportEmailer(object):
-    """Warning collector and emailer."""
+    """Warning collector and emailer.
+
+    All warnings are sent to ``to_addr`` (unless it is None).  ``routes``
+    is a list of (pattern, address) tuples; the warnings about modules
+    whose names match a pattern (e.g. 'my.pkg.*', see ``fnmatch``) are
+    sent to its address as well, in a separate email.
+    """
 
     def __init__(self, from_addr, to_addr, subject, web_url=None,
-                 mailer=None):
+                 mailer=None, routes=()):
         if not mailer:
             mailer = MailSender()
         self.from_addr = from_addr
@@ -259,27 +825,62 @@ class ReportEmailer(object):
         self.subject = subject
         self.web_url = web_url
         self.mailer = mailer
+        self.routes = list(routes)
         self.warnings = []
+        # The warnings for the address of every route
+        self.routed_warnings = {}
 
     def warn(self, filename, message):
         """Warn about test coverage regression."""
         module = strip(os.path.basename(filename), '.cover')
-        self.warnings.append('{}: {}'.format(module, message))
+        warning = ['{}: {}'.format(module, message)]
         if self.web_url:
             url = urljoin(self.web_url, module + '.html')
-            self.warnings.append('See ' + url + '\n')
+            warning.append('See ' + url + '\n')
+        self.warnings.extend(warning)
+        addresses = []
+        for pattern, address in self.routes:
+            if (fnmatch.fnmatchcase(module, pattern) and
+                    address not in addresses):
+                addresses.append(address)
+                self.routed_warnings.setdefault(address, []).extend(warning)
 
     def send(self):
-        """Send the warnings (if any)."""
-        if self.warnings:
-            body = '\n'.join(self.warnings)
-            self.mailer.send_email(self.from_addr, self.to_addr, self.subject,
-                                   body)
+        """Send the warnings (if any).
+
+        All emails are sent over the same connection.
+        """
+        messages = []
+        if self.warnings and self.to_addr:
+            messages.append((self.to_addr, self.warnings))
+        for pattern, address in self.routes:
+            if address in self.routed_warnings:
+                messages.append((address, self.routed_warnings.pop(address)))
+        if not messages:
+            return
+        connect = getattr(self.mailer, 'connect', None)
+        if connect is not None:
+            connect()
+        try:
+            for to_addr, warnings in messages:
+                self.mailer.send_email(self.from_addr, to_addr, self.subject,
+                                       '\n'.join(warnings))
+        finally:
+            if connect is not None:
+                self.mailer.quit()
 
 
 def main():
     """Parse command line arguments and do stuff."""
-    parser = optparse.OptionParser("usage: %prog [options] olddir newdir")
+    parser = optparse.OptionParser(
+        "usage: %prog [options] olddir newdir\n"
+        "       %prog --save-baseline=FILE [options] [olddir] newdir",
+        description=(
+            'Reports regressions in test coverage.  Either of the two'
+            ' directories of .cover files can also be a .coverage file'
+            ' produced by coverage.py, or a baseline file.  A glob pattern'
+            ' that matches several directories or .coverage files, e.g. from'
+            ' parallel test runs, merges their coverage.'))
     parser.add_option('--include', metavar='REGEX',
                       help='only consider files matching REGEX',
                       action='append')
@@ -289,6 +890,10 @@ def main():
     parser.add_option('--email', metavar='ADDR',
                       help='send the report to a given email address'
                            ' (only if regressions were found)',)
+    parser.add_option('--route', metavar='PATTERN=ADDR', action='append',
+                      help='also send the regressions in modules matching'
+                           ' PATTERN (e.g. my.pkg.*) to a given email address'
+                           ' (can be given several times)')
     parser.add_option('--from', metavar='ADDR', dest='sender',
                       help='set the email sender address')
     parser.add_option('--subject', metavar='SUBJECT',
@@ -297,19 +902,52 @@ def main():
     parser.add_option('--web-url', metavar='BASEURL', dest='web_url',
                       help='include hyperlinks to HTML-ized coverage'
                            ' reports at a given URL')
+    parser.add_option('--lines', action='store_true',
+                      help='compare modules line by line, and list the'
+                           ' lines that are no longer tested')
+    parser.add_option('-j', '--jobs', metavar='N', type='int', default=1,
+                      help='compare N modules at a time (default: 1)')
+    parser.add_option('--save-baseline', metavar='FILE',
+                      help='save the coverage of newdir to a baseline file,'
+                           ' which can take the place of olddir later')
+    parser.add_option('--strip-prefix', metavar='PREFIX',
+                      help='strip base directory from filenames loaded'
+                           ' from .coverage')
+    parser.add_option('--path-alias', metavar='PATH=LOCALPATH',
+                      help='define path mappings for filenames loaded'
+                           ' from .coverage',
+                      action='append')
     opts, args = parser.parse_args()
-    if len(args) != 2:
+    if len(args) == 1 and opts.save_baseline:
+        olddir, newdir = None, args[0]
+    elif len(args) != 2:
         parser.error("wrong number of arguments")
-    olddir, newdir = args
-    if opts.email:
-        reporter = ReportEmailer(
-            opts.sender, opts.email, opts.subject, opts.web_url)
     else:
-        reporter = ReportPrinter(opts.web_url)
-    compare_dirs(olddir, newdir, include=opts.include, exclude=opts.exclude,
-                 warn=reporter.warn)
-    if opts.email:
-        reporter.send()
+        olddir, newdir = args
+    routes = []
+    for route in opts.route or []:
+        pattern, sep, address = route.partition('=')
+        if not sep or not pattern or not address:
+            parser.error("--route must be PATTERN=ADDR")
+        routes.append((pattern, address))
+    if olddir is not None:
+        if opts.email or routes:
+            reporter = ReportEmailer(
+                opts.sender, opts.email, opts.subject, opts.web_url,
+                routes=routes)
+        else:
+            reporter = ReportPrinter(opts.web_url)
+        compare_dirs(olddir, newdir, include=opts.include,
+                     exclude=opts.exclude, warn=reporter.warn,
+                     strip_prefix=opts.strip_prefix,
+                     path_aliases=opts.path_alias, lines=opts.lines,
+                     jobs=opts.jobs)
+        if opts.email or routes:
+            reporter.send()
+    if opts.save_baseline:
+        write_baseline(newdir, opts.save_baseline, include=opts.include,
+                       exclude=opts.exclude, strip_prefix=opts.strip_prefix,
+                       path_aliases=opts.path_alias, jobs=opts.jobs)
 
 
 if __name__ == '__main__':
@@ -42,16 +42,50 @@ from __future__ import print_function
 
 import sys
 import os
+import contextlib
+import cProfile
+import csv
 import datetime
-import cgi
+import errno
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import shutil
+import keyword
+import locale
 import subprocess
 import optparse
 import tempfile
+import time
+import tokenize
+import multiprocessing
+import multiprocessing.pool
+
+try:
+    from html import escape
+except ImportError:  # pragma: nocover
+    from cgi import escape
+
+try:
+    import sqlite3
+except ImportError:  # pragma: nocover
+    # Python built without SQLite
+    sqlite3 = None
 
 import coverage
 from coverage.data import CoverageData
 from coverage.files import PathAliases, relative_filename
 
+try:
+    from z3c.coverage import coverfile
+except ImportError:  # pragma: nocover
+    # Running as a script next to coverfile.py
+    import coverfile
+
 
 HIGHLIGHT_COMMAND = ['enscript', '-q', '--footer', '--header', '-h',
                      '--language=html', '--highlight=python', '--color',
@@ -60,6 +94,53 @@ HIGHLIGHT_COMMAND = ['enscript', '-q', '--footer', '--header', '-h',
 #: Expected encoding of highlight command (enscript).
 HIGHLIGHT_CMD_ENCODING = 'latin1'
 
+#: Name of the syntax highlighter used for source code, a key of HIGHLIGHTERS.
+HIGHLIGHTER = 'enscript'
+
+#: Markup used by the built-in Python highlighter.  It mimics the colours
+#: of enscript, so reports look the same whichever highlighter you use.
+PYTHON_HIGHLIGHT_STYLES = {
+    'comment': ('<I><FONT COLOR="#B22222">', '</FONT></I>'),
+    'string': ('<FONT COLOR="#BC8F8F"><B>', '</B></FONT>'),
+    'keyword': ('<B><FONT COLOR="#A020F0">', '</FONT></B>'),
+    'name': ('<B><FONT COLOR="#0000FF">', '</FONT></B>'),
+}
+
+#: Width of the coverage information prefix of lines in .cover files.
+PREFIX_WIDTH = 7
+
+#: Maximum number of files passed to a single run of a batch highlighter.
+HIGHLIGHT_BATCH_SIZE = 1000
+
+#: Version of the built-in Python highlighter.  Change it whenever its
+#: output changes, so that cached output of older versions is not used.
+PYTHON_HIGHLIGHTER_VERSION = '1'
+
+#: Persistent cache of syntax-highlighted source code (a HighlightCache), or
+#: None for no caching.
+HIGHLIGHT_CACHE = None
+
+#: Persistent cache of the statements of measured source files (an
+#: AnalysisCache), or None for no caching.
+ANALYSIS_CACHE = None
+
+#: Name of a stylesheet file in the report directory that all pages link
+#: to, or None to include the styles in every page.
+STYLESHEET = None
+
+#: Whether to write gzip-compressed report files (with an added .gz
+#: extension), for web servers that serve them as they are: None for no
+#: compression, 'also' for writing them next to the uncompressed files, or
+#: 'only' for writing only compressed files.
+GZIP = None
+
+#: Compression level of gzip-compressed report files (1-9).
+GZIP_LEVEL = 9
+
+#: Timings instance that collects the time spent in every phase of the run,
+#: or None (see ``Timings``).
+TIMINGS = None
+
 
 class Lazy(object):
     """Descriptor for lazy evaluation"""
@@ -106,7 +187,30 @@ class CoverageNode(dict):
 
     @Lazy
     def html_source(self):
-        return ''
+        with timed('highlighting'):
+            text = self.get_cover_text()
+            if text is None:
+                return ''
+            return format_html_source(syntax_highlight_text(text))
+
+    def get_cover_text(self):
+        """Return this node's source code annotated like in a .cover file.
+
+        Returns None if the node has no source code.
+        """
+        return None
+
+    def fingerprint(self, previous=None):
+        """Return a fingerprint of the input this node was loaded from.
+
+        The fingerprint is a dict; its ``hash`` changes whenever the
+        annotated source code of the node changes.  ``previous`` is an
+        earlier fingerprint of the same module, which saves reading files
+        that have not been modified since.
+
+        Returns None if the node has no source code.
+        """
+        return None
 
     def __str__(self):
         return '%s%% covered (%s of %s lines uncovered)' % \
@@ -134,6 +238,16 @@ class CoverageNode(dict):
             parent = parent.setdefault(name, CoverageNode())
         parent[path[-1]] = node
 
+    def detach(self):
+        """Return a shallow copy of this node without any child nodes.
+
+        The copy keeps the attributes needed to render the node's own page,
+        and is cheap to pass to a worker process.
+        """
+        node = self.__class__.__new__(self.__class__)
+        node.__dict__.update(self.__dict__)
+        return node
+
 
 class TraceCoverageNode(CoverageNode):
     """Coverage node loaded from an annotated source file."""
@@ -144,37 +258,76 @@ class TraceCoverageNode(CoverageNode):
 
     def _parse(self, filename):
         """Parse a plain-text coverage report and return (covered, total)."""
-        covered = 0
-        total = 0
-        with open(filename) as file:
-            for line in file:
-                if line.startswith(' ' * 7) or len(line) < 7:
-                    continue
-                total += 1
-                if not line.startswith('>>>>>>'):
-                    covered += 1
-        return (covered, total)
+        covered, uncovered = coverfile.count_file(filename)
+        return (covered, covered + uncovered)
+
+    def get_cover_text(self):
+        with open(self.cover_filename) as file:
+            return file.read()
+
+    def fingerprint(self, previous=None):
+        fingerprint = file_fingerprint(self.cover_filename, previous)
+        fingerprint['hash'] = fingerprint['source']
+        return fingerprint
 
-    @Lazy
-    def html_source(self):
-        text = syntax_highlight(self.cover_filename)
-        text = highlight_uncovered_lines(text)
-        return '<pre>%s</pre>' % text
+
+class MergedTraceCoverageNode(TraceCoverageNode):
+    """Coverage node merged from several annotated source files.
+
+    The files are the coverage of the same module from several test runs
+    (see ``coverfile.merge_lines``).  They are merged once, and the result
+    is kept for the page of the module.
+    """
+
+    def __init__(self, cover_filenames):
+        self.cover_filenames = list(cover_filenames)
+        self.cover_filename = self.cover_filenames[0]
+        self.merged = coverfile.merge_files(self.cover_filenames)
+        covered, uncovered = coverfile.count_coverage(self.merged)
+        self.covered, self.total = covered, covered + uncovered
+
+    def get_cover_text(self):
+        # The same encoding as open() in TraceCoverageNode
+        return self.merged.decode(locale.getpreferredencoding(False))
+
+    def fingerprint(self, previous=None):
+        previous_files = (previous or {}).get('files', {})
+        files = dict((filename, file_fingerprint(
+                          filename, previous_files.get(filename)))
+                     for filename in self.cover_filenames)
+        sources = [files[filename]['source']
+                   for filename in self.cover_filenames]
+        return {'files': files,
+                'hash': hashlib.sha256(
+                    ' '.join(sources).encode('ascii')).hexdigest()}
 
 
 class CoverageCoverageNode(CoverageNode):
     """Coverage node loaded from a coverage.py data file."""
 
-    def __init__(self, cov, source_filename):
+    def __init__(self, cov, source_filename, analysis=None):
+        """Create a node for a measured file.
+
+        ``analysis`` is a (statements, excluded, missing) tuple as returned
+        by ``analyze_coverage``.  If omitted, the file is analyzed now.
+        """
         self.cov = cov
         self.source_filename = source_filename
-        (filename_again, statements, excluded, missing,
-         missing_str) = cov.analysis2(source_filename)
+        if analysis is None:
+            analysis = analyze_coverage_file(cov, source_filename)
+        statements, excluded, missing = analysis
         self.covered = len(statements) - len(excluded) - len(missing)
         self.total = len(statements) - len(excluded)
-        self._missing = set(missing)
-        self._statements = set(statements)
-        self._excluded = set(excluded)
+        # Tuples take a lot less memory than sets.
+        self._missing = tuple(missing)
+        self._statements = tuple(statements)
+        self._excluded = tuple(excluded)
+
+    def detach(self):
+        node = super(CoverageCoverageNode, self).detach()
+        # The coverage object is only needed for the analysis.
+        del node.cov
+        return node
 
     @Lazy
     def annotated_source(self):
@@ -183,37 +336,437 @@ class CoverageCoverageNode(CoverageNode):
         EXCLUDED  = '     # '
         OTHER     = '       '
         lines = []
-        f = open(self.source_filename)
-        for n, line in enumerate(f, start=1):
-            if n in self._missing:      prefix = MISSING
-            elif n in self._excluded:   prefix = EXCLUDED
-            elif n in self._statements: prefix = STATEMENT
-            else:                       prefix = OTHER
-            lines.append(prefix + line)
+        missing = set(self._missing)
+        excluded = set(self._excluded)
+        statements = set(self._statements)
+        with open(self.source_filename) as f:
+            for n, line in enumerate(f, start=1):
+                if n in missing:      prefix = MISSING
+                elif n in excluded:   prefix = EXCLUDED
+                elif n in statements: prefix = STATEMENT
+                else:                 prefix = OTHER
+                lines.append(prefix + line)
         return ''.join(lines)
 
-    @Lazy
-    def html_source(self):
-        tmpdir = tempfile.mkdtemp(prefix='z3c.coverage')
-        tmpfilename = os.path.join(tmpdir,
-                            os.path.basename(self.source_filename) + '.cover')
-        tmpf = open(tmpfilename, 'w')
-        tmpf.write(self.annotated_source)
-        tmpf.close()
-        text = syntax_highlight(tmpf.name)
-        os.unlink(tmpfilename)
-        os.rmdir(tmpdir)
-        text = highlight_uncovered_lines(text)
-        return '<pre>%s</pre>' % text
+    def get_cover_text(self):
+        return self.annotated_source
+
+    def fingerprint(self, previous=None):
+        fingerprint = file_fingerprint(self.source_filename, previous)
+        lines = repr([sorted(self._statements), sorted(self._excluded),
+                      sorted(self._missing)])
+        fingerprint['lines'] = hashlib.sha256(
+            lines.encode('ascii')).hexdigest()
+        fingerprint['hash'] = hashlib.sha256(
+            (fingerprint['source'] + fingerprint['lines']).encode('ascii')
+        ).hexdigest()
+        return fingerprint
+
+
+class FileCache(object):
+    """Persistent cache of texts computed from some data.
+
+    Every entry is a file in ``directory``, named after a hash of the data
+    and of everything else the text depends on (see ``key``).
+
+    ``max_size`` limits the total size of the entries, in bytes.  ``prune``
+    removes the least recently used entries that exceed it.
+
+    Several processes can safely share a cache directory: entries are
+    written atomically, and entries removed by other processes are simply
+    treated as missing.
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, data, *parts):
+        """Return the cache key for data.
+
+        ``data`` is bytes.  ``parts`` are strings describing how the text
+        is computed from it, e.g. the name and version of a program.
+        """
+        key = hashlib.sha256()
+        for part in parts:
+            key.update(part.encode('utf-8') + b'\0')
+        key.update(data)
+        return key.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """Return the cached text for a key, or None if there is none."""
+        filename = self._filename(key)
+        try:
+            with io.open(filename, encoding='utf-8') as file:
+                text = file.read()
+            # Remember when the entry was last used, for ``prune``.
+            os.utime(filename, None)
+        except (IOError, OSError):
+            return None
+        return text
+
+    def set(self, key, text):
+        """Store the text for a key."""
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmpfilename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with io.open(fd, 'w', encoding='utf-8') as file:
+                file.write(text)
+            if os.name == 'nt' and os.path.exists(filename):
+                os.unlink(filename)
+            os.rename(tmpfilename, filename)
+        except BaseException:
+            os.unlink(tmpfilename)
+            raise
+
+    def prune(self):
+        """Remove the least recently used entries exceeding ``max_size``."""
+        if self.max_size is None:
+            return
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue  # being written by another process
+                filename = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue  # removed by another process
+                entries.append((st.st_mtime, st.st_size, filename))
+        total = sum(size for mtime, size, filename in entries)
+        for mtime, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass  # removed by another process
+            total -= size
+
+
+class HighlightCache(FileCache):
+    """Persistent cache of syntax-highlighted source code.
+
+    The entries are keyed by the annotated source code, the name of the
+    highlighter and its version.
+    """
+
+    def highlight_key(self, data, highlighter):
+        """Return the cache key for annotated source code.
+
+        ``data`` is the annotated source code, as bytes.
+        """
+        version = HIGHLIGHTER_VERSIONS.get(highlighter, lambda: '')()
+        return self.key(data, highlighter, version)
+
+
+class AnalysisCache(FileCache):
+    """Persistent cache of the statements of Python source files.
+
+    Finding the statements in a source file means parsing it, which is
+    what takes most of the time of a coverage.py analysis.  The results
+    only depend on the source code, the version of coverage.py and Python,
+    and the exclusion rules, so they are stored with a hash of all of these
+    as the key.
+    """
+
+    def analysis_key(self, data, cov):
+        """Return the cache key for source code.
+
+        ``data`` is the source code, as bytes.  ``cov`` is the
+        coverage.coverage() instance used for analyzing it.
+        """
+        return self.key(data, coverage.__version__, sys.version.split()[0],
+                        repr(cov.get_option('report:exclude_lines')))
+
+
+def file_fingerprint(filename, previous=None):
+    """Return a fingerprint of a file.
+
+    The fingerprint is a dict with the modification time, the size and
+    a hash of the contents (``source``) of the file.  The hash is taken
+    from ``previous``, an earlier fingerprint of the same file, if the
+    modification time and the size have not changed.
+    """
+    st = os.stat(filename)
+    fingerprint = {'mtime': st.st_mtime, 'size': st.st_size}
+    if (previous and previous.get('mtime') == st.st_mtime and
+            previous.get('size') == st.st_size):
+        fingerprint['source'] = previous['source']
+    else:
+        with open(filename, 'rb') as file:
+            fingerprint['source'] = hashlib.sha256(file.read()).hexdigest()
+    return fingerprint
+
+
+class ReportManifest(object):
+    """Record of the inputs of the HTML pages in a report directory.
+
+    The manifest is kept in a file named ``manifest.json`` in the report
+    directory.  For every page, it has the fingerprint of the input of its
+    tree node (see ``CoverageNode.fingerprint``) and a hash of the table
+    rows of the page.  A page is only generated again if one of these
+    changes, or if the syntax highlighter or the ``revision`` in the footer
+    of the pages is not the same as before.
+    """
+
+    filename = 'manifest.json'
+    format_version = 1
+
+    def __init__(self, report_path, revision=None):
+        self.report_path = report_path
+        self.revision = revision
+        self.settings = self.get_settings()
+        self.old_pages = {}
+        self.listed_pages = []
+        self.pages = {}
+        try:
+            with open(os.path.join(report_path, self.filename)) as file:
+                data = json.load(file)
+        except (IOError, OSError, ValueError):
+            return  # no usable manifest: generate everything
+        self.listed_pages = list(data.get('pages', {}))
+        if data.get('settings') == self.settings:
+            self.old_pages = data.get('pages', {})
+
+    def get_settings(self):
+        """Describe the settings that affect every page."""
+        version = HIGHLIGHTER_VERSIONS.get(HIGHLIGHTER, lambda: '')()
+        return [self.format_version, HIGHLIGHTER, version, STYLESHEET, GZIP,
+                self.revision]
+
+    def check_page(self, page, node, rows):
+        """Check which parts of a page have changed since the last run.
+
+        ``page`` is the file name of the page, relative to the report
+        directory.  ``rows`` is the HTML for its table rows.
+
+        Returns a tuple (rows_changed, source_changed).
+        """
+        old = self.old_pages.get(page, {})
+        old_input = old.get('input')
+        fingerprint = node.fingerprint(old_input)
+        rows_hash = hashlib.sha256(rows.encode('utf-8')).hexdigest()
+        self.pages[page] = {'input': fingerprint, 'rows': rows_hash}
+        filename = os.path.join(self.report_path, page)
+        if GZIP is not None:
+            filename += '.gz'
+        if not os.path.exists(filename):
+            return (True, True)
+        source_changed = (
+            'input' not in old or
+            (fingerprint and fingerprint['hash']) !=
+            (old_input and old_input['hash']))
+        return (rows_hash != old.get('rows'), source_changed)
+
+    def remove_old_pages(self):
+        """Remove the pages of the last run that this run did not check.
+
+        These are the pages of modules that no longer have coverage data.
+        """
+        for page in self.listed_pages:
+            if page in self.pages:
+                continue
+            filename = os.path.join(self.report_path, page)
+            for name in [filename, filename + '.gz']:
+                if os.path.exists(name):
+                    os.unlink(name)
+
+    def save(self):
+        """Write the manifest for the pages checked during this run."""
+        filename = os.path.join(self.report_path, self.filename)
+        tmpfilename = filename + '.tmp'
+        with open(tmpfilename, 'w') as file:
+            json.dump({'settings': self.settings, 'pages': self.pages}, file,
+                      sort_keys=True)
+        if os.name == 'nt' and os.path.exists(filename):
+            os.unlink(filename)
+        os.rename(tmpfilename, filename)
+
+
+class Timings(object):
+    """Time spent in the phases of a report run, and on every page.
+
+    Pass an instance as ``opts.timings`` to ``make_coverage_reports`` to
+    collect the timings of a run.  The phases are 'tree' (loading the
+    coverage), 'analysis' (of source files of coverage.py data),
+    'highlighting', 'rendering' and 'writing'.  Phases can be nested; the
+    time spent in a nested phase is not counted in the enclosing one:
+
+        >>> timings = Timings()
+        >>> with timings.phase('rendering'):
+        ...     with timings.phase('writing'):
+        ...         pass
+        >>> sorted(timings.phases)
+        ['rendering', 'writing']
+
+    The time spent on a page includes all the phases.  The timings of
+    worker processes are added up, so they can be longer than the run.
+
+    ``add_phase`` and ``add_page`` are called for every timed interval and
+    page, so a subclass can extend them to pass the timings on, e.g. to a
+    monitoring system.
+    """
+
+    clock = staticmethod(getattr(time, 'perf_counter', time.time))
+
+    def __init__(self):
+        # Seconds by phase name
+        self.phases = {}
+        # Seconds by page name (see ``index_to_name``)
+        self.pages = {}
+        # The [name, start] of the running phases, innermost last
+        self._running = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of the run (a context manager)."""
+        now = self.clock()
+        if self._running:
+            # Stop the clock of the enclosing phase.
+            outer = self._running[-1]
+            self.add_phase(outer[0], now - outer[1])
+        self._running.append([name, now])
+        try:
+            yield
+        finally:
+            now = self.clock()
+            name, start = self._running.pop()
+            self.add_phase(name, now - start)
+            if self._running:
+                self._running[-1][1] = now
+
+    @contextlib.contextmanager
+    def page(self, name):
+        """Time the generation of a page (a context manager)."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_page(name, self.clock() - start)
+
+    def add_phase(self, name, seconds):
+        """Count time spent in a phase."""
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def add_page(self, name, seconds):
+        """Count time spent on a page."""
+        self.pages[name] = self.pages.get(name, 0) + seconds
+
+    def slowest(self, n=10):
+        """Return (name, seconds) tuples for the ``n`` slowest pages."""
+        return heapq.nlargest(n, self.pages.items(),
+                              key=lambda item: (item[1], item[0]))
+
+    def as_dict(self):
+        """Return the timings as a dict (e.g. for JSON)."""
+        return {'phases': dict(self.phases), 'pages': dict(self.pages)}
+
+    def update(self, data):
+        """Add timings returned by ``as_dict``, e.g. of a worker process."""
+        for name, seconds in data['phases'].items():
+            self.add_phase(name, seconds)
+        for name, seconds in data['pages'].items():
+            self.add_page(name, seconds)
+
+    def report(self, output, slowest=10):
+        """Print the time spent in every phase, and on the slowest pages."""
+        print('Time spent in every phase:', file=output)
+        for name, seconds in sorted(self.phases.items(),
+                                    key=lambda item: -item[1]):
+            print('  %-14s %9.3f s' % (name, seconds), file=output)
+        if slowest and self.pages:
+            print('Slowest pages:', file=output)
+            for name, seconds in self.slowest(slowest):
+                print('  %9.3f s  %s' % (seconds, name), file=output)
+
+    def write_json(self, filename, slowest=10):
+        """Write the time spent in every phase and on the slowest pages."""
+        data = {'phases': self.phases,
+                'slowest_pages': [{'name': name, 'seconds': seconds}
+                                  for name, seconds in self.slowest(slowest)]}
+        with open(filename, 'w') as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+
+class NotTimed(object):
+    """A context manager that does nothing, for when there is no TIMINGS."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def timed(phase):
+    """Time a phase of the run in TIMINGS, if set (a context manager)."""
+    if TIMINGS is None:
+        return NotTimed()
+    return TIMINGS.phase(phase)
+
+
+def timed_page(name):
+    """Time the generation of a page in TIMINGS, if set."""
+    if TIMINGS is None:
+        return NotTimed()
+    return TIMINGS.page(name)
+
+
+def read_html_source(filename):
+    """Return the source code part of an HTML file written by write_html.
+
+    Reads the compressed file if GZIP is 'only'.
+
+    Returns None if the file cannot be read.
+    """
+    try:
+        if GZIP == 'only':
+            with gzip.open(filename + '.gz') as file:
+                text = file.read()
+            if not isinstance(text, str):
+                text = text.decode(locale.getpreferredencoding(False))
+        else:
+            with open(filename) as file:
+                text = file.read()
+    except (IOError, OSError, ValueError):
+        return None
+    start = text.find(SOURCE_MARKER)
+    end = text.rfind(FOOTER_MARKER)
+    if start == -1 or end == -1:
+        return None
+    # write_html puts a newline after the source code.
+    return text[start + len(SOURCE_MARKER):end - 1]
 
 
 def get_file_list(path, filter_fn=None):
     """Return a list of files in a directory.
 
     If you can specify a predicate (a callable), only file names matching it
-    will be returned.
+    will be returned.  Subdirectories are never returned.
     """
-    return filter(filter_fn, os.listdir(path))
+    try:
+        scandir = os.scandir
+    except AttributeError:  # pragma: nocover
+        # Python 2
+        return [filename for filename in filter(filter_fn, os.listdir(path))
+                if not os.path.isdir(os.path.join(path, filename))]
+    # scandir() usually knows whether an entry is a directory without
+    # having to stat() it.
+    return [entry.name for entry in scandir(path)
+            if (filter_fn is None or filter_fn(entry.name)) and
+            not entry.is_dir()]
 
 
 def filename_to_list(filename):
@@ -228,34 +781,99 @@ def filename_to_list(filename):
     return filename.split('.')[:-1]
 
 
-def create_tree_from_files(filelist, path):
+def create_tree_from_files(filelist, path, jobs=1):
     """Create a tree with coverage statistics.
 
     Takes the directory for coverage reports and a list of filenames relative
     to that directory.  Parses all the files and constructs a module tree with
     coverage statistics.
 
+    If ``jobs`` is greater than 1, that many files are read concurrently by
+    a pool of threads, which helps when reading a file takes long, e.g. on
+    a network file system.  The tree is the same either way.
+
+    Returns the root node of the tree.
+    """
+    return create_tree_from_groups(
+        [(filename, [os.path.join(path, filename)]) for filename in filelist],
+        jobs=jobs)
+
+
+def create_tree_from_dirs(paths, filter_fn=None, jobs=1):
+    """Create a tree with the merged coverage statistics of directories.
+
+    Takes the names of several directories for coverage reports, e.g. from
+    shards of a test suite.  The coverage files with the same name are
+    merged (see ``MergedTraceCoverageNode``).
+
     Returns the root node of the tree.
     """
+    # A k-way merge of the sorted file lists brings files with the same
+    # name together, without a dict of all the files of all directories.
+    listings = [[(filename, os.path.join(path, filename))
+                 for filename in sorted(get_file_list(path, filter_fn))]
+                for path in paths]
+    groups = [(filename, [filepath for filename, filepath in group])
+              for filename, group in itertools.groupby(
+                  heapq.merge(*listings), key=lambda item: item[0])]
+    return create_tree_from_groups(groups, jobs=jobs)
+
+
+def create_tree_from_groups(groups, jobs=1):
+    """Create a tree with coverage statistics.
+
+    Takes a list of (filename, filepaths) tuples, where ``filename`` is the
+    name of a coverage file, and ``filepaths`` are the pathnames of the
+    files with that name, which are merged if there are several.
+
+    If ``jobs`` is greater than 1, that many files are read concurrently by
+    a pool of threads (see ``create_tree_from_files``).
+
+    Returns the root node of the tree.
+    """
+    filepaths = [filepaths for filename, filepaths in groups]
+    if jobs <= 1 or len(filepaths) <= 1:
+        nodes = [_make_trace_node(paths) for paths in filepaths]
+    else:
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            nodes = pool.map(_make_trace_node, filepaths)
+        finally:
+            pool.close()
+            pool.join()
     root = CoverageNode()
-    for filename in filelist:
-        tree_index = filename_to_list(filename)
-        filepath = os.path.join(path, filename)
-        root.set_at(tree_index, TraceCoverageNode(filepath))
+    for (filename, paths), node in zip(groups, nodes):
+        root.set_at(filename_to_list(filename), node)
+    compute_totals(root)
     return root
 
 
-def create_tree_from_coverage(cov, strip_prefix=None, path_aliases=None):
+def _make_trace_node(filepaths):
+    """Create a node for one coverage file, or several merged ones."""
+    if len(filepaths) == 1:
+        return TraceCoverageNode(filepaths[0])
+    return MergedTraceCoverageNode(filepaths)
+
+
+def create_tree_from_coverage(cov, strip_prefix=None, path_aliases=None,
+                              jobs=1, data_files=None):
     """Create a tree with coverage statistics.
 
     Takes a coverage.coverage() instance.
 
+    ``jobs`` is the number of worker processes used for analyzing the
+    measured files, and ``data_files`` the names of the data files merged
+    into ``cov`` (see ``analyze_coverage``).
+
     Returns the root node of the tree.
     """
     root = CoverageNode()
+    alias_map = None
     if path_aliases:
-        apply_path_aliases(cov, dict([alias.partition('=')[::2]
-                                      for alias in path_aliases]))
+        alias_map = dict([alias.partition('=')[::2]
+                          for alias in path_aliases])
+        apply_path_aliases(cov, alias_map)
+    files = []
     for filename in cov.data.measured_files():
         if strip_prefix and filename.startswith(strip_prefix):
             short_name = filename[len(strip_prefix):]
@@ -266,10 +884,178 @@ def create_tree_from_coverage(cov, strip_prefix=None, path_aliases=None):
         tree_index = filename_to_list(short_name.replace(os.path.sep, '.'))
         if 'tests' in tree_index or 'ftests' in tree_index:
             continue
-        root.set_at(tree_index, CoverageCoverageNode(cov, filename))
+        files.append((tree_index, filename))
+    filenames = [filename for tree_index, filename in files]
+    with timed('analysis'):
+        analyses = analyze_coverage(cov, filenames, jobs=jobs,
+                                    alias_map=alias_map,
+                                    data_files=data_files)
+    for tree_index, filename in files:
+        root.set_at(tree_index,
+                    CoverageCoverageNode(cov, filename, analyses[filename]))
+    compute_totals(root)
     return root
 
 
+def analyze_coverage_file(cov, filename):
+    """Analyze a measured file with coverage.py.
+
+    Returns a (statements, excluded, missing) tuple of tuples of line
+    numbers.
+
+    If ANALYSIS_CACHE is set, the statements of source code that has been
+    analyzed before are taken from it, and only the lines that were not
+    executed are computed.
+    """
+    cache = ANALYSIS_CACHE
+    analysis = None
+    if cache is not None:
+        with open(filename, 'rb') as file:
+            source = file.read()
+        key = cache.analysis_key(source, cov)
+        text = cache.get(key)
+        if text is not None:
+            analysis = json.loads(text)
+        else:
+            analysis = find_statements(cov, filename,
+                                       source.count(b'\n') + 1)
+            if analysis is not None:
+                cache.set(key, json.dumps(analysis))
+    if analysis is None:
+        (filename_again, statements, excluded, missing,
+         missing_str) = cov.analysis2(filename)
+        return (tuple(statements), tuple(excluded), tuple(missing))
+    statements = analysis['statements']
+    multiline = dict(analysis['multiline'])
+    executed = set(multiline.get(line, line)
+                   for line in cov.data.lines(filename) or ())
+    missing = [line for line in statements if line not in executed]
+    return (tuple(statements), tuple(analysis['excluded']), tuple(missing))
+
+
+def find_statements(cov, filename, nlines):
+    """Find the statements of a source file with coverage.py.
+
+    Returns a dict with the sorted line numbers of the ``statements`` and
+    the ``excluded`` statements, and a list of (line, first_line) pairs
+    for the lines of statements spanning several lines (``multiline``).
+    Coverage data may refer to any line of such statements.
+
+    Returns None if the installed version of coverage.py cannot do this.
+    """
+    # This is what cov.analysis2() does, except for looking at the coverage
+    # data.  coverage.py has no public API for getting the file reporter,
+    # so versions that lack this private method are not supported; their
+    # analyses are not cached.
+    get_file_reporter = getattr(cov, '_get_file_reporter', None)
+    if get_file_reporter is None:
+        return None
+    file_reporter = get_file_reporter(filename)
+    multiline = []
+    for line in range(1, nlines + 1):
+        first_lines = file_reporter.translate_lines([line])
+        if len(first_lines) == 1 and line not in first_lines:
+            multiline.append((line, first_lines.pop()))
+    return {'statements': sorted(file_reporter.lines()),
+            'excluded': sorted(file_reporter.excluded_lines()),
+            'multiline': multiline}
+
+
+def analyze_coverage(cov, filenames, jobs=1, alias_map=None,
+                     data_files=None):
+    """Analyze many measured files with coverage.py.
+
+    Returns a dict mapping file names to the results of
+    ``analyze_coverage_file``.
+
+    Parsing the source code of the files is slow, so if ``jobs`` is greater
+    than 1, the files are analyzed by a pool of that many worker processes.
+    Each worker loads the coverage data of ``cov`` again, from its data file
+    or from ``data_files`` if several were merged (see
+    ``merge_coverage_data``), and applies ``alias_map`` (see
+    ``apply_path_aliases``) to it.
+    """
+    if jobs <= 1 or len(filenames) <= 1:
+        return dict((filename, analyze_coverage_file(cov, filename))
+                    for filename in filenames)
+    chunksize = -(-len(filenames) // (jobs * 4))
+    pool = multiprocessing.Pool(jobs, initializer=_init_analysis_worker,
+                                initargs=(data_files or
+                                          [cov.config.data_file],
+                                          alias_map, ANALYSIS_CACHE))
+    try:
+        analyses = dict(pool.imap_unordered(_analyze_coverage_file_job,
+                                            filenames, chunksize))
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return analyses
+
+
+# The coverage.coverage() instance of an analysis worker process.
+_analysis_cov = None
+
+
+def _init_analysis_worker(data_files, alias_map, analysis_cache):
+    """Load the coverage data in an analysis worker process."""
+    global _analysis_cov, ANALYSIS_CACHE
+    ANALYSIS_CACHE = analysis_cache
+    _analysis_cov = merge_coverage_data(data_files)
+    if alias_map:
+        apply_path_aliases(_analysis_cov, alias_map)
+
+
+def _analyze_coverage_file_job(filename):
+    """Call ``analyze_coverage_file`` in an analysis worker process."""
+    return filename, analyze_coverage_file(_analysis_cov, filename)
+
+
+def compute_totals(tree):
+    """Compute the coverage statistics of all packages in a tree.
+
+    The ``covered`` and ``total`` of every package are computed from those
+    of its children in a single bottom-up pass over the tree.  Computing
+    them on demand would recurse as deep as the tree is.
+
+    A node that has children and statistics of its own, like a module
+    whose name is also that of a package, gets the sum of both.  The
+    totals are therefore computed only once, when the tree is built.
+    """
+    nodes = [tree]
+    for node in nodes:
+        nodes.extend(node.values())
+    # Children come after their parents in the list.
+    for node in reversed(nodes):
+        if node:
+            # Plain package nodes have no statistics of their own, only
+            # nodes loaded from coverage data set them when they are made.
+            node.covered = (node.__dict__.get('covered', 0) +
+                            sum(child.covered for child in node.values()))
+            node.total = (node.__dict__.get('total', 0) +
+                          sum(child.total for child in node.values()))
+
+
+def merge_coverage_data(data_files):
+    """Load several coverage.py data files, e.g. from parallel test runs.
+
+    The data is merged in memory, without writing a combined data file.
+
+    Returns a coverage.coverage() instance, whose data file is the first
+    one.
+    """
+    cov = coverage.coverage(data_file=data_files[0], config_file=False)
+    cov.load()
+    for data_file in data_files[1:]:
+        data = CoverageData()
+        data.read_file(data_file)
+        cov.data.update(data)
+    return cov
+
+
 def apply_path_aliases(cov, alias_map):
     """Adjust filenames in coverage data."""
     data = CoverageData()
@@ -287,9 +1073,7 @@ def traverse_tree(tree, index, function):
 
     ``function`` gets one argument: the path of a node.
     """
-    function(tree, index)
-    for key, node in tree.items():
-        traverse_tree(node, index + [key], function)
+    _traverse(tree, index, function, lambda node: node.items())
 
 
 def traverse_tree_in_order(tree, index, function, order_by):
@@ -301,9 +1085,46 @@ def traverse_tree_in_order(tree, index, function, order_by):
 
     ``order_by`` gets one argument a tuple of (key, node).
     """
+    _traverse(tree, index, function,
+              lambda node: sorted(node.items(), key=order_by))
+
+
+def _traverse(tree, index, function, get_children):
+    """Preorder traversal of a tree, without recursion.
+
+    ``get_children`` returns the (key, node) pairs of a node in the order
+    in which they are visited.
+    """
+    # Deep trees would exceed the recursion limit.  The stack holds a link
+    # to every ancestor of the current node and an iterator over its
+    # remaining children.  A link is a (parent link, key) pair, so all the
+    # nodes below a package share its link, and the stack does not grow
+    # with the square of the depth; the path of a node is only built from
+    # its link when it is visited.
     function(tree, index)
-    for key, node in sorted(tree.items(), key=order_by):
-        traverse_tree_in_order(node, index + [key], function, order_by)
+    stack = [(None, iter(get_children(tree)))]
+    while stack:
+        link, children = stack[-1]
+        for key, node in children:
+            node_link = (link, key)
+            function(node, _link_to_path(index, node_link))
+            stack.append((node_link, iter(get_children(node))))
+            break
+        else:
+            stack.pop()
+
+
+def _link_to_path(index, link):
+    """Return the path of a node from its link in ``_traverse``.
+
+    ``index`` is the path of the root node.
+    """
+    keys = []
+    while link is not None:
+        link, key = link
+        keys.append(key)
+    keys.reverse()
+    return index + keys
 
 
 def index_to_url(index):
@@ -343,35 +1164,92 @@ def percent_to_colour(percent):
 
 def print_table_row(html, node, file_index):
     """Generate a row for an HTML table."""
+    html.write(table_row(node, file_index))
+
+
+def table_row(node, file_index):
+    """Return the HTML for a row of a table."""
     nice_name = index_to_nice_name(file_index)
     if not node.keys():
         nice_name += '.py'
     else:
         nice_name += '/'
-    print('<tr><td><a href="%s">%s</a></td>' %
-              (index_to_url(file_index), nice_name), file=html)
-    print('<td style="background: %s">&nbsp;&nbsp;&nbsp;&nbsp;</td>' %
-              (percent_to_colour(node.percent)), file=html)
-    print('<td>covered %s%% (%s of %s uncovered)</td></tr>' %
-              (node.percent, node.uncovered, node.total), file=html)
+    return ROW % (index_to_url(file_index), nice_name,
+                  percent_to_colour(node.percent),
+                  node.percent, node.uncovered, node.total)
 
 
-HEADER = """
-    <html>
-      <head><title>Test coverage for %(name)s</title>
-      <style type="text/css">
+ROW = """\
+<tr><td><a href="%s">%s</a></td>
+<td style="background: %s">&nbsp;&nbsp;&nbsp;&nbsp;</td>
+<td>covered %s%% (%s of %s uncovered)</td></tr>
+"""
+
+
+STYLES = """\
         a {text-decoration: none; display: block; padding-right: 1em;}
         a:hover {background: #EFA;}
         hr {height: 1px; border: none; border-top: 1px solid gray;}
         .notcovered {background: #FCC;}
         .footer {margin: 2em; font-size: small; color: gray;}
-      </style>
+"""
+
+INLINE_STYLES = """<style type="text/css">
+%s      </style>""" % STYLES
+
+STYLESHEET_LINK = '<link rel="stylesheet" type="text/css" href="%s" />'
+
+
+HEADER = """
+    <html>
+      <head><title>Test coverage for %(name)s</title>
+      %(styles)s
       </head>
       <body><h1>Test coverage for %(name)s</h1>
       <table>
     """
 
 
+def render_header(name):
+    """Return the HTML for the start of a page, up to the table rows."""
+    if STYLESHEET is None:
+        styles = INLINE_STYLES
+    else:
+        styles = STYLESHEET_LINK % STYLESHEET
+    return HEADER % {'name': name, 'styles': styles}
+
+
+def write_stylesheet(report_path, filename=None):
+    """Write the stylesheet file that the pages link to, if any.
+
+    ``filename`` is the name of the file.  If omitted, STYLESHEET is used.
+    """
+    filename = filename or STYLESHEET
+    if filename is not None:
+        write_report_file(os.path.join(report_path, filename), STYLES)
+
+
+def write_report_file(filename, text):
+    """Write a file of the report.
+
+    Depending on GZIP, a gzip-compressed copy of the file is written too,
+    or instead of it.
+    """
+    with timed('writing'):
+        if GZIP != 'only':
+            with open(filename, 'w') as file:
+                file.write(text)
+        if GZIP is not None:
+            if not isinstance(text, bytes):
+                # The same encoding as that of the uncompressed file
+                text = text.encode(locale.getpreferredencoding(False))
+            with open(filename + '.gz', 'wb') as file:
+                # Leave out the time, so that unchanged files stay the same.
+                with gzip.GzipFile(os.path.basename(filename), 'wb',
+                                   GZIP_LEVEL, file, mtime=0) as gzfile:
+                    gzfile.write(text)
+
+
 FOOTER = """
       <div class="footer">
       %s
@@ -379,8 +1257,13 @@ FOOTER = """
     </body>
     </html>"""
 
+# Text surrounding the source code in the HTML files.
+SOURCE_MARKER = '</table><hr/>\n'
+FOOTER_MARKER = FOOTER[:FOOTER.index('%s')]
 
-def generate_html(output_filename, tree, my_index, info, path, footer=""):
+
+def generate_html(output_filename, tree, my_index, info, path, footer="",
+                  nodes=None, row_cache=None):
     """Generate HTML for a tree node.
 
     ``output_filename`` is the output file name.
@@ -393,47 +1276,419 @@ def generate_html(output_filename, tree, my_index, info, path, footer=""):
     ``info`` is a list of paths of child nodes.
 
     ``path`` is the directory name for the plain-text report files.
+
+    ``nodes`` is an optional mapping from node paths (as tuples) to nodes,
+    used instead of looking every path up from the root of the tree.
+
+    ``row_cache`` is an optional dict for keeping the HTML of table rows
+    (see ``prepare_html``).
+    """
+    with timed('rendering'):
+        rows, node = prepare_html(tree, my_index, info, nodes, row_cache)
+    write_html(output_filename, my_index, rows, node, footer)
+
+
+def prepare_html(tree, my_index, info, nodes=None, row_cache=None):
+    """Prepare the data needed to generate HTML for a tree node.
+
+    Takes the same arguments as ``generate_html``.
+
+    ``row_cache`` is an optional dict in which the HTML of table rows is
+    kept, by node path (as a tuple), as most rows appear on many pages.
+
+    Returns a tuple (rows, node), where ``rows`` is the HTML for the table
+    rows of all the nodes listed in ``info``, and ``node`` is the node at
+    ``my_index``.
     """
-    html = open(output_filename, 'w')
-    print(HEADER % {'name': index_to_name(my_index)}, file=html)
-    info = [(tree.get_at(node_path), node_path) for node_path in info]
+    if nodes is None:
+        get_node = tree.get_at
+    else:
+        def get_node(node_path):
+            return nodes[tuple(node_path)]
+    info = [(get_node(node_path), node_path) for node_path in info]
 
     def key(node_info):
         (node, node_path) = node_info
         return (len(node_path), -node.uncovered, node_path and node_path[-1])
     info.sort(key=key)
+    rows = []
     for node, file_index in info:
         if not file_index:
             continue  # skip root node
-        print_table_row(html, node, file_index)
-    print('</table><hr/>', file=html)
-    source = tree.get_at(my_index).html_source
-    if not isinstance(source, str):
-        source = source.encode(HIGHLIGHT_CMD_ENCODING)
-    print(source, file=html)
-    print(FOOTER % footer, file=html)
-    html.close()
-
-
-def syntax_highlight(filename):
-    """Return HTML with syntax-highlighted Python code from a file."""
-    # TODO: use pygments instead
+        if row_cache is None:
+            rows.append(table_row(node, file_index))
+            continue
+        file_index = tuple(file_index)
+        row = row_cache.get(file_index)
+        if row is None:
+            row = row_cache[file_index] = table_row(node, file_index)
+        rows.append(row)
+    return ''.join(rows), get_node(my_index)
+
+
+def write_html(output_filename, my_index, rows, node, footer=""):
+    """Write an HTML file for a tree node.
+
+    ``rows`` is the HTML for the table rows, as returned by ``prepare_html``.
+
+    ``node`` is the tree node itself.  Only its ``html_source`` is used, so
+    it can be a detached copy without child nodes.
+    """
+    with timed_page(index_to_name(my_index)), timed('rendering'):
+        source = node.html_source
+        if not isinstance(source, str):
+            source = source.encode(HIGHLIGHT_CMD_ENCODING)
+        page = ''.join([render_header(index_to_name(my_index)), '\n',
+                        rows, SOURCE_MARKER, source, '\n',
+                        FOOTER % footer, '\n'])
+        write_report_file(output_filename, page)
+
+
+def _init_worker(highlighter, highlight_cache, stylesheet, gzip_mode,
+                 gzip_level, timings=False):
+    """Configure a worker process like the main process.
+
+    If ``timings`` is true, the worker collects timings for the main
+    process (see ``_run_timed_job``).
+    """
+    global HIGHLIGHTER, HIGHLIGHT_CACHE, STYLESHEET, GZIP, GZIP_LEVEL
+    global TIMINGS
+    HIGHLIGHTER = highlighter
+    HIGHLIGHT_CACHE = highlight_cache
+    STYLESHEET = stylesheet
+    GZIP = gzip_mode
+    GZIP_LEVEL = gzip_level
+    TIMINGS = Timings() if timings else None
+
+
+def _run_timed_job(args):
+    """Run a job in a worker process, and return the timings of the job.
+
+    ``args`` is a tuple (job, job_args).  Returns the timings as a dict
+    (see ``Timings.as_dict``), or None if the worker does not collect any.
+    """
+    global TIMINGS
+    job, job_args = args
+    job(job_args)
+    if TIMINGS is None:
+        return None
+    timings, TIMINGS = TIMINGS, Timings()
+    return timings.as_dict()
+
+
+def write_html_batch(pages, batch_highlight=False):
+    """Write HTML files for several tree nodes.
+
+    ``pages`` is a list of argument tuples for ``write_html``.
+
+    If ``batch_highlight`` is true, the source code of all the nodes is
+    highlighted at once (see ``highlight_batch``).
+    """
+    if batch_highlight:
+        with timed('highlighting'):
+            highlight_batch([page[3] for page in pages])
+    for page in pages:
+        write_html(*page)
+
+
+def _write_html_batch_job(args):
+    """Call ``write_html_batch`` in a worker process."""
+    write_html_batch(*args)
+
+
+def syntax_highlight(filename, highlighter=None):
+    """Return HTML with syntax-highlighted Python code from a file.
+
+    See ``syntax_highlight_text``.
+    """
+    with open(filename) as file:
+        return syntax_highlight_text(file.read(), highlighter)
+
+
+def syntax_highlight_text(text, highlighter=None):
+    """Return HTML with syntax-highlighted Python code.
+
+    ``highlighter`` is the name of the syntax highlighter to use (see
+    HIGHLIGHTERS).  If omitted, HIGHLIGHTER is used.
+
+    If HIGHLIGHT_CACHE is set, previously highlighted code is taken from it.
+    """
+    highlighter = highlighter or HIGHLIGHTER
+    cache = HIGHLIGHT_CACHE
+    if cache is None:
+        return HIGHLIGHTERS[highlighter](text)
+    key = cache.highlight_key(text.encode('utf-8'), highlighter)
+    html = cache.get(key)
+    if html is None:
+        html = HIGHLIGHTERS[highlighter](text)
+        cache.set(key, html)
+    return html
+
+
+def enscript_highlight(text):
+    """Return HTML with Python code highlighted by enscript.
+
+    The code is passed to enscript on its standard input.
+    """
     try:
-        pipe = subprocess.Popen(HIGHLIGHT_COMMAND + [filename],
+        pipe = subprocess.Popen(HIGHLIGHT_COMMAND, stdin=subprocess.PIPE,
                                 stdout=subprocess.PIPE)
-        text, stderr = pipe.communicate()
+        html, stderr = pipe.communicate(text.encode('utf-8'))
         if pipe.returncode != 0:
             raise OSError
     except OSError:
         # Failed to run enscript; maybe it is not installed?  Disable
         # syntax highlighting then.
-        with open(filename, 'r') as file:
-            text = cgi.escape(file.read())
-    else:
-        text = text.decode(HIGHLIGHT_CMD_ENCODING)
-        text = text[text.find('<PRE>') + len('<PRE>'):]
-        text = text[:text.find('</PRE>')]
-    return text
+        return plain_highlight(text)
+    html = html.decode(HIGHLIGHT_CMD_ENCODING)
+    html = html[html.find('<PRE>') + len('<PRE>'):]
+    return html[:html.find('</PRE>')]
+
+
+def enscript_version():
+    """Return a string identifying the version and options of enscript."""
+    program = HIGHLIGHT_COMMAND[0]
+    if program not in _enscript_versions:
+        try:
+            pipe = subprocess.Popen([program, '--version'],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            stdout, stderr = pipe.communicate()
+            version = stdout.decode(HIGHLIGHT_CMD_ENCODING).split('\n')[0]
+        except OSError:
+            version = 'not available'
+        _enscript_versions[program] = version
+    return ' '.join([_enscript_versions[program]] + HIGHLIGHT_COMMAND)
+
+
+# Versions of enscript, by program name, so it is only asked once.
+_enscript_versions = {}
+
+
+def python_highlighter_version():
+    """Return a string identifying the version of the Python highlighter."""
+    # The tokenize module changes between Python versions.
+    return '%s python%d.%d' % ((PYTHON_HIGHLIGHTER_VERSION,) +
+                               tuple(sys.version_info[:2]))
+
+
+def enscript_highlight_many(texts):
+    """Return HTML with Python code highlighted by enscript.
+
+    All the code is highlighted by a single run of enscript.  Returns a
+    list with the HTML for every item of ``texts``.
+    """
+    if len(texts) <= 1:
+        return [enscript_highlight(text) for text in texts]
+    # enscript can only tell many inputs apart if they are separate files.
+    # Their names are short and relative to the temporary directory, so that
+    # the command line of even a very large batch is not too long.
+    tmpdir = tempfile.mkdtemp(prefix='z3c.coverage')
+    try:
+        filenames = []
+        for n, text in enumerate(texts):
+            filename = '%d' % n
+            with open(os.path.join(tmpdir, filename), 'wb') as file:
+                file.write(text.encode('utf-8'))
+            filenames.append(filename)
+        try:
+            pipe = subprocess.Popen(HIGHLIGHT_COMMAND + filenames,
+                                    stdout=subprocess.PIPE, cwd=tmpdir)
+            html, stderr = pipe.communicate()
+            if pipe.returncode != 0:
+                raise OSError
+        except OSError:
+            # Failed to run enscript; maybe it is not installed?  Disable
+            # syntax highlighting then.
+            return [plain_highlight(text) for text in texts]
+    finally:
+        shutil.rmtree(tmpdir)
+    html = html.decode(HIGHLIGHT_CMD_ENCODING)
+    # enscript puts the code of every file in a <PRE> element of its own.
+    htmls = [fragment[:fragment.find('</PRE>')]
+             for fragment in html.split('<PRE>')[1:]]
+    if len(htmls) != len(texts):
+        # Cannot tell which code belongs to which file.
+        print("Warning: %s gave %d HTML fragments for %d files; highlighting"
+              " them one at a time" % (HIGHLIGHT_COMMAND[0], len(htmls),
+                                       len(texts)), file=sys.stderr)
+        return [enscript_highlight(text) for text in texts]
+    return htmls
+
+
+def plain_highlight(text):
+    """Return HTML with Python code, without highlighting."""
+    return escape(text, False)
+
+
+def highlight_cover_text(text):
+    r"""Return HTML with syntax-highlighted Python code from a .cover file.
+
+    ``text`` is the contents of a plain-text coverage report.  The
+    coverage information prefixes are not treated as part of the source
+    code, and every line of the result is valid HTML on its own:
+
+        >>> print(highlight_cover_text(
+        ...     '    1: def f(x):  # <f>\n'
+        ...     '>>>>>>     return "%s" % x\n'))
+        ... # doctest: +NORMALIZE_WHITESPACE
+            1: <B><FONT COLOR="#A020F0">def</FONT></B>
+               <B><FONT COLOR="#0000FF">f</FONT></B>(x):
+               <I><FONT COLOR="#B22222"># &lt;f&gt;</FONT></I>
+        &gt;&gt;&gt;&gt;&gt;&gt;
+               <B><FONT COLOR="#A020F0">return</FONT></B>
+               <FONT COLOR="#BC8F8F"><B>"%s"</B></FONT> % x
+
+    Code that cannot be tokenized is not highlighted from the point of the
+    error onwards:
+
+        >>> print(highlight_cover_text(
+        ...     '    1: if x:  # a\n'
+        ...     '    1:     y\n'
+        ...     '    1:   z  # b\n'))
+        ... # doctest: +NORMALIZE_WHITESPACE
+            1: <B><FONT COLOR="#A020F0">if</FONT></B> x:
+               <I><FONT COLOR="#B22222"># a</FONT></I>
+            1:     y
+            1:   z  # b
+
+    """
+    prefixes = []
+    code_lines = []
+    for line in text.splitlines(True):
+        prefix = line.rstrip('\r\n')[:PREFIX_WIDTH]
+        prefixes.append(prefix)
+        code_lines.append(line[len(prefix):])
+    spans = python_highlight_spans(code_lines)
+    result = []
+    span_index = 0
+    for row, (prefix, code) in enumerate(zip(prefixes, code_lines), 1):
+        result.append(escape(prefix, False))
+        col = 0
+        while span_index < len(spans):
+            (start_row, start_col), (end_row, end_col), style = \
+                spans[span_index]
+            if start_row > row:
+                break
+            if start_row < row:
+                start_col = 0
+            if end_row > row:
+                end_col = len(code.rstrip('\r\n'))
+            else:
+                span_index += 1
+            if start_col < end_col:
+                start_tag, end_tag = PYTHON_HIGHLIGHT_STYLES[style]
+                result.append(escape(code[col:start_col], False))
+                result.append(start_tag)
+                result.append(escape(code[start_col:end_col], False))
+                result.append(end_tag)
+                col = end_col
+            if end_row > row:
+                break
+        result.append(escape(code[col:], False))
+    return ''.join(result)
+
+
+def python_highlight_spans(code_lines):
+    """Find the parts of Python source code that need highlighting.
+
+    Returns a list of ((start_row, start_col), (end_row, end_col), style)
+    tuples, in the same order as they appear in the source.  Rows are
+    1-based and columns are 0-based, like in the ``tokenize`` module.
+    """
+    spans = []
+    lines = iter(code_lines)
+    string_tokens = set([tokenize.STRING])
+    for name in 'FSTRING_START', 'FSTRING_MIDDLE', 'FSTRING_END':
+        if hasattr(tokenize, name):  # Python 3.12+
+            string_tokens.add(getattr(tokenize, name))
+    previous = None
+    try:
+        for token in tokenize.generate_tokens(lambda: next(lines, '')):
+            token_type, token_string, start, end = token[:4]
+            if token_type == tokenize.COMMENT:
+                style = 'comment'
+            elif token_type in string_tokens:
+                style = 'string'
+            elif token_type != tokenize.NAME:
+                style = None
+            elif keyword.iskeyword(token_string):
+                style = 'keyword'
+            elif previous in ('def', 'class'):
+                style = 'name'
+            else:
+                style = None
+            if style and start != end:
+                spans.append((start, end, style))
+            if token_type not in (tokenize.NL, tokenize.COMMENT):
+                previous = token_string
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return spans
+
+
+#: Syntax highlighters, by name.  A highlighter is a function that takes
+#: the contents of a .cover file and returns HTML.
+HIGHLIGHTERS = {
+    'enscript': enscript_highlight,
+    'python': highlight_cover_text,
+}
+
+#: Functions returning the version of syntax highlighters, by name.  The
+#: version is a part of the keys of HighlightCache entries.
+HIGHLIGHTER_VERSIONS = {
+    'enscript': enscript_version,
+    'python': python_highlighter_version,
+}
+
+#: Syntax highlighters that can process many files at once, by name.  A
+#: batch highlighter takes a list of .cover file contents and returns a list
+#: of HTML texts.  Highlighters that have no batch version are run once per
+#: file.
+BATCH_HIGHLIGHTERS = {
+    'enscript': enscript_highlight_many,
+}
+
+
+def format_html_source(text):
+    """Return HTML for syntax-highlighted source code of a module."""
+    return '<pre>%s</pre>' % highlight_uncovered_lines(text)
+
+
+def highlight_batch(nodes):
+    """Syntax-highlight the source code of many tree nodes at once.
+
+    Uses a single run of the batch highlighter registered for HIGHLIGHTER
+    in BATCH_HIGHLIGHTERS to compute ``html_source`` of all the nodes.  Does
+    nothing if HIGHLIGHTER has no batch highlighter.
+    """
+    highlight_many = BATCH_HIGHLIGHTERS.get(HIGHLIGHTER)
+    if highlight_many is None:
+        return
+    cache = HIGHLIGHT_CACHE
+    texts = []
+    targets = []
+    for node in nodes:
+        if 'html_source' in node.__dict__:
+            continue  # already computed
+        text = node.get_cover_text()
+        if text is None:
+            continue
+        key = None
+        if cache is not None:
+            key = cache.highlight_key(text.encode('utf-8'), HIGHLIGHTER)
+            html = cache.get(key)
+            if html is not None:
+                node.html_source = format_html_source(html)
+                continue
+        texts.append(text)
+        targets.append((node, key))
+    if texts:
+        htmls = highlight_many(texts)
+        for (node, key), html in zip(targets, htmls):
+            if key is not None:
+                cache.set(key, html)
+            node.html_source = format_html_source(html)
 
 
 def highlight_uncovered_lines(text):
@@ -449,7 +1704,8 @@ def highlight_uncovered_lines(text):
     return text
 
 
-def generate_htmls_from_tree(tree, path, report_path, footer=""):
+def generate_htmls_from_tree(tree, path, report_path, footer="", jobs=1,
+                             batch_highlight=False, manifest=None):
     """Generate HTML files for all nodes in the tree.
 
     ``tree`` is the root node of the tree.
@@ -457,44 +1713,319 @@ def generate_htmls_from_tree(tree, path, report_path, footer=""):
     ``path`` is the directory name for the plain-text report files.
 
     ``report_path`` is the directory name for the output files.
+
+    ``jobs`` is the number of worker processes used for writing the pages.
+    If it is 1 (the default), all pages are written by the current process.
+
+    If ``batch_highlight`` is true, the syntax highlighter is run once for
+    many modules at a time, instead of once per module.  Every process then
+    runs it once for every HIGHLIGHT_BATCH_SIZE pages.
+
+    ``manifest`` is an optional ReportManifest.  If given, pages that have
+    not changed since the last run are not written again, and pages with
+    unchanged source code reuse the highlighted code from the last run.
     """
+    # Preorder traversal visits every parent before its children, so the
+    # index of already visited nodes always contains all the ancestors of
+    # the current node.
+    nodes = {}
+    pages = []
+    row_cache = {}
+
     def make_html(node, my_index):
-        info = []
-
-        def list_parents_and_children(node, index):
-            position = len(index)
-            my_position = len(my_index)
-            if position <= my_position and index == my_index[:position]:
-                info.append(index)
-            elif (position == my_position + 1 and
-                  index[:my_position] == my_index):
-                info.append(index)
-            return
-        traverse_tree(tree, [], list_parents_and_children)
-        output_filename = os.path.join(report_path, index_to_url(my_index))
+        nodes[tuple(my_index)] = node
         if not my_index:
             return  # skip root node
-        generate_html(output_filename, tree, my_index, info, path, footer)
+        info = [my_index[:position] for position in range(len(my_index) + 1)]
+        info.extend(my_index + [key] for key in node)
+        for key, child in node.items():
+            nodes[tuple(my_index + [key])] = child
+        output_filename = os.path.join(report_path, index_to_url(my_index))
+        if jobs > 1 or batch_highlight or manifest is not None:
+            # Workers get the table rows and a detached copy of the node
+            # instead of the whole tree.
+            with timed('rendering'):
+                rows, node = prepare_html(tree, my_index, info, nodes,
+                                          row_cache)
+            node = node.detach()
+            if manifest is not None:
+                rows_changed, source_changed = manifest.check_page(
+                    index_to_url(my_index), node, rows)
+                if not rows_changed and not source_changed:
+                    return
+                if not source_changed:
+                    source = read_html_source(output_filename)
+                    if source is not None:
+                        node.html_source = source
+            pages.append((output_filename, my_index, rows, node, footer))
+        else:
+            generate_html(output_filename, tree, my_index, info, path,
+                          footer, nodes=nodes, row_cache=row_cache)
     traverse_tree(tree, [], make_html)
+    run_batches(_write_html_batch_job, pages, jobs, batch_highlight)
+
+
+def run_batches(job, pages, jobs=1, batch_highlight=False):
+    """Write pages in batches, in ``jobs`` worker processes.
+
+    ``job`` is called with a tuple (batch, batch_highlight) for every batch,
+    where ``batch`` is a list of items of ``pages``.  With batch highlighting
+    batches are at most HIGHLIGHT_BATCH_SIZE pages.
+    """
+    if not pages:
+        return
+    if batch_highlight:
+        nbatches = max(jobs, -(-len(pages) // HIGHLIGHT_BATCH_SIZE))
+    else:
+        nbatches = jobs * 4
+    batch_size = -(-len(pages) // nbatches)
+    batches = [(pages[start:start + batch_size], batch_highlight)
+               for start in range(0, len(pages), batch_size)]
+    if jobs <= 1:
+        for batch in batches:
+            job(batch)
+        return
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker,
+                                initargs=(HIGHLIGHTER, HIGHLIGHT_CACHE,
+                                          STYLESHEET, GZIP, GZIP_LEVEL,
+                                          TIMINGS is not None))
+    try:
+        for timings in pool.imap_unordered(
+                _run_timed_job, [(job, batch) for batch in batches]):
+            if timings is not None and TIMINGS is not None:
+                TIMINGS.update(timings)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
 
 
 def generate_overall_html_from_tree(tree, output_filename, footer=""):
     """Generate an overall HTML file for all nodes in the tree."""
-    html = open(output_filename, 'w')
-    print(HEADER % {'name': ', '.join(sorted(tree.keys()))}, file=html)
+    page = [render_header(', '.join(sorted(tree.keys()))), '\n']
 
     def print_node(node, file_index):
         if file_index:  # skip root node
-            print_table_row(html, node, file_index)
+            page.append(table_row(node, file_index))
 
     def sort_by(node_info):
         (key, node) = node_info
         return (-node.uncovered, key)
 
-    traverse_tree_in_order(tree, [], print_node, sort_by)
-    print('</table><hr/>', file=html)
-    print(FOOTER % footer, file=html)
-    html.close()
+    with timed('rendering'):
+        traverse_tree_in_order(tree, [], print_node, sort_by)
+        page.extend([SOURCE_MARKER, FOOTER % footer, '\n'])
+        write_report_file(output_filename, ''.join(page))
+
+
+SINGLE_PAGE = """\
+<html>
+  <head><title>Test coverage for %(name)s</title>
+  <link rel="stylesheet" type="text/css" href="%(stylesheet)s" />
+  <style type="text/css">
+    iframe {width: 100%%; height: 75%%; border: none;}
+  </style>
+  </head>
+  <body><h1 id="title">Test coverage for %(name)s</h1>
+  <table id="rows"></table><hr/>
+  <iframe id="source"></iframe>
+  <div class="footer">
+  %(footer)s
+  </div>
+  <script type="application/json" id="coverage-index">%(index)s</script>
+  <script type="text/javascript">%(script)s</script>
+  </body>
+</html>
+"""
+
+# Renders the table of a page of the multi-page report for the node named
+# in the URL fragment, and shows the source code of modules in the iframe.
+SINGLE_PAGE_SCRIPT = """
+(function () {
+  var tree = JSON.parse(
+    document.getElementById('coverage-index').textContent);
+  var sourceDir = %(source_dir)s;
+  function colour(percent) {
+    if (percent == 100) return 'green';
+    if (percent >= 95) return '#74F300';
+    if (percent >= 90) return 'yellow';
+    if (percent >= 80) return 'orange';
+    return 'red';
+  }
+  function percent(node) {
+    return node[2] ? Math.floor(100 * node[1] / node[2]) : 100;
+  }
+  function uncovered(node) {
+    return node[2] - node[1];
+  }
+  function row(node, path) {
+    var p = percent(node);
+    var name = new Array(4 * (path.length - 1) + 1).join('\\u00a0') +
+      node[0] + (node[3] ? '/' : '.py');
+    var tr = document.createElement('tr');
+    var td = document.createElement('td');
+    var a = document.createElement('a');
+    a.href = '#' + path.join('.');
+    a.textContent = name;
+    td.appendChild(a);
+    tr.appendChild(td);
+    td = document.createElement('td');
+    td.style.background = colour(p);
+    td.textContent = '\\u00a0\\u00a0\\u00a0\\u00a0';
+    tr.appendChild(td);
+    td = document.createElement('td');
+    td.textContent = 'covered ' + p + '%% (' + uncovered(node) + ' of ' +
+      node[2] + ' uncovered)';
+    tr.appendChild(td);
+    return tr;
+  }
+  function render() {
+    var names = location.hash.slice(1).split('.');
+    var ancestors = [tree];
+    var node = tree;
+    var path = [];
+    for (var i = 0; i < names.length && node[3]; i++) {
+      var child = null;
+      for (var j = 0; j < node[3].length; j++) {
+        if (node[3][j][0] === names[i]) child = node[3][j];
+      }
+      if (!child) break;
+      node = child;
+      path.push(child[0]);
+      ancestors.push(child);
+    }
+    var rows = document.getElementById('rows');
+    rows.textContent = '';
+    for (i = 1; i < ancestors.length; i++) {
+      rows.appendChild(row(ancestors[i], path.slice(0, i)));
+    }
+    var children = (node[3] || []).slice();
+    children.sort(function (a, b) {
+      return uncovered(b) - uncovered(a) || (a[0] < b[0] ? -1 : 1);
+    });
+    for (i = 0; i < children.length; i++) {
+      rows.appendChild(row(children[i], path.concat([children[i][0]])));
+    }
+    document.getElementById('title').textContent = 'Test coverage for ' +
+      (path.length ? path.join('.') : 'everything');
+    var source = document.getElementById('source');
+    if (path.length && !node[3]) {
+      source.src = sourceDir + '/' + path.join('.') + '.html';
+      source.style.display = '';
+    } else {
+      source.removeAttribute('src');
+      source.style.display = 'none';
+    }
+  }
+  window.onhashchange = render;
+  render();
+})();
+"""
+
+SOURCE_FRAGMENT = """\
+<html>
+  <head><link rel="stylesheet" type="text/css" href="../%s" /></head>
+  <body>
+%s
+  </body>
+</html>
+"""
+
+#: Directory for the source code of modules in single-page reports.
+SOURCE_DIR = 'source'
+
+
+def tree_to_index(tree):
+    """Return a compact representation of a tree for JSON.
+
+    Every node is a list [name, covered, total], with the list of child
+    nodes as a fourth item for packages:
+
+        >>> root = CoverageNode()
+        >>> root.set_at(['z3c', 'coverage'], CoverageNode())
+        >>> root['z3c']['coverage'].covered = 3
+        >>> root['z3c']['coverage'].total = 4
+        >>> tree_to_index(root)
+        ['', 3, 4, [['z3c', 3, 4, [['coverage', 3, 4]]]]]
+
+    """
+    entries = {}
+
+    def add_entry(node, index):
+        entry = [index[-1] if index else '', node.covered, node.total]
+        if node:
+            entry.append([])
+        if index:
+            entries[tuple(index[:-1])][3].append(entry)
+        entries[tuple(index)] = entry
+
+    traverse_tree(tree, [], add_entry)
+    return entries[()]
+
+
+def generate_single_page_report(tree, report_path, footer="", jobs=1,
+                                batch_highlight=False):
+    """Generate a report with a single HTML page for all nodes in the tree.
+
+    The page contains a JSON index of the tree, and renders the tables of
+    all nodes in the browser.  The highlighted source code of every module
+    is written to a file of its own in the SOURCE_DIR subdirectory, and
+    shown in the page when the module is selected.
+
+    The size of the report grows linearly with the size of the source
+    code, instead of with its size times the depth of the tree.
+
+    ``jobs`` and ``batch_highlight`` work like for
+    ``generate_htmls_from_tree``.
+    """
+    with timed('rendering'):
+        index = json.dumps(tree_to_index(tree), separators=(',', ':'))
+        script = SINGLE_PAGE_SCRIPT % {'source_dir': json.dumps(SOURCE_DIR)}
+        write_report_file(
+            os.path.join(report_path, 'index.html'), SINGLE_PAGE % {
+                'name': 'everything',
+                'stylesheet': STYLESHEET or 'coverage.css',
+                'footer': footer,
+                # "</" would end the script element.
+                'index': index.replace('</', '<\\/'),
+                'script': script})
+    source_path = os.path.join(report_path, SOURCE_DIR)
+    if not os.path.exists(source_path):
+        os.mkdir(source_path)
+    fragments = []
+
+    def add_fragment(node, index):
+        if index and not node:
+            fragments.append((os.path.join(source_path, index_to_url(index)),
+                              node.detach()))
+
+    traverse_tree(tree, [], add_fragment)
+    run_batches(_write_source_batch_job, fragments, jobs, batch_highlight)
+
+
+def write_source_fragment(output_filename, node):
+    """Write an HTML file with the source code of a tree node."""
+    name = os.path.splitext(os.path.basename(output_filename))[0]
+    with timed_page(name), timed('rendering'):
+        source = node.html_source
+        if not isinstance(source, str):
+            source = source.encode(HIGHLIGHT_CMD_ENCODING)
+        write_report_file(output_filename,
+                          SOURCE_FRAGMENT % (STYLESHEET or 'coverage.css',
+                                             source))
+
+
+def _write_source_batch_job(args):
+    """Write a batch of source code files in a worker process."""
+    fragments, batch_highlight = args
+    if batch_highlight:
+        with timed('highlighting'):
+            highlight_batch([node for output_filename, node in fragments])
+    for output_filename, node in fragments:
+        write_source_fragment(output_filename, node)
 
 
 def create_report_path(report_path):
@@ -502,6 +2033,67 @@ def create_report_path(report_path):
         os.makedirs(report_path)
 
 
+#: Output formats that write the coverage statistics instead of HTML pages.
+SUMMARY_FORMATS = ('json', 'csv')
+
+#: Fields of every record of a summary.
+SUMMARY_FIELDS = ('name', 'type', 'covered', 'total', 'percent')
+
+
+def write_summary(tree, output, format='json'):
+    """Write the coverage statistics of every node in the tree to a file.
+
+    ``output`` is an open file, and ``format`` is 'json' or 'csv'.  The
+    records are written in the order of the report, while the tree is
+    traversed, and without looking at the source code of the modules:
+
+        >>> root = CoverageNode()
+        >>> root.set_at(['z3c', 'coverage'], CoverageNode())
+        >>> root['z3c']['coverage'].covered = 3
+        >>> root['z3c']['coverage'].total = 4
+        >>> write_summary(root, sys.stdout, 'csv')
+        name,type,covered,total,percent
+        everything,package,3,4,75
+        z3c,package,3,4,75
+        z3c.coverage,module,3,4,75
+        >>> write_summary(root, sys.stdout, 'json')
+        ... # doctest: +NORMALIZE_WHITESPACE
+        [
+        {"covered": 3, "name": "everything", "percent": 75, "total": 4,
+         "type": "package"},
+        {"covered": 3, "name": "z3c", "percent": 75, "total": 4,
+         "type": "package"},
+        {"covered": 3, "name": "z3c.coverage", "percent": 75, "total": 4,
+         "type": "module"}
+        ]
+
+    """
+    if format == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(SUMMARY_FIELDS)
+
+        def write_record(node, index):
+            writer.writerow([index_to_name(index),
+                             'package' if node else 'module',
+                             node.covered, node.total, node.percent])
+    else:
+        output.write('[')
+
+        def write_record(node, index):
+            # The root comes first, so every other record follows a comma.
+            output.write('\n' if not index else ',\n')
+            output.write(json.dumps({'name': index_to_name(index),
+                                     'type': 'package' if node else 'module',
+                                     'covered': node.covered,
+                                     'total': node.total,
+                                     'percent': node.percent},
+                                    sort_keys=True))
+
+    traverse_tree_in_order(tree, [], write_record, lambda item: item[0])
+    if format != 'csv':
+        output.write('\n]\n')
+
+
 def filter_fn(filename):
     """Filter interesting coverage files.
 
@@ -530,38 +2122,168 @@ def filter_fn(filename):
             'ftests' not in parts)
 
 
+def expand_paths(patterns):
+    """Expand glob patterns in a list of pathnames.
+
+    Pathnames that do not match any files are kept as they are.
+    """
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
 def load_coverage(path, opts):
     """Load coverage information from ``path``.
 
     ``path`` can point to a directory full of files named *.cover, or it can
-    point to a single pickle file containing coverage information.
+    point to a single pickle file containing coverage information.  It can
+    also be a list of several directories, or of several data files, whose
+    coverage is merged.
+
+    ``opts.jobs`` is the number of workers (default: 1).
     """
-    if os.path.isdir(path):
-        filelist = get_file_list(path, filter_fn)
-        tree = create_tree_from_files(filelist, path)
-        return tree
+    jobs = getattr(opts, 'jobs', 1)
+    paths = [path] if not isinstance(path, (list, tuple)) else list(path)
+    if all(os.path.isdir(path) for path in paths):
+        with timed('tree'):
+            if len(paths) > 1:
+                return create_tree_from_dirs(paths, filter_fn, jobs=jobs)
+            filelist = get_file_list(paths[0], filter_fn)
+            tree = create_tree_from_files(filelist, paths[0], jobs=jobs)
+            return tree
+    elif any(os.path.isdir(path) for path in paths):
+        raise ValueError('cannot merge directories of .cover files with'
+                         ' coverage.py data files')
     else:
-        cov = coverage.coverage(data_file=path, config_file=False)
-        cov.load()
-        tree = create_tree_from_coverage(cov, strip_prefix=opts.strip_prefix,
-                                         path_aliases=opts.path_alias)
-        return tree
+        with timed('tree'):
+            cov = merge_coverage_data(paths)
+            tree = create_tree_from_coverage(
+                cov, strip_prefix=opts.strip_prefix,
+                path_aliases=opts.path_alias, jobs=jobs, data_files=paths)
+            return tree
+
+
+def settings_from_options(opts):
+    """Return the module settings to use for a run with the options ``opts``.
+
+    The result maps names of module globals to values.  Options that
+    ``opts`` lacks, or that are None, leave their setting at the value of
+    the module global.  ``opts.timings`` can be a ``Timings`` instance to
+    collect the timings of the run in.
+    """
+    def option(name, default=None):
+        value = getattr(opts, name, None)
+        return default if value is None else value
+
+    settings = {
+        'HIGHLIGHTER': option('highlighter', HIGHLIGHTER),
+        'HIGHLIGHT_BATCH_SIZE': option('highlight_batch_size',
+                                       HIGHLIGHT_BATCH_SIZE),
+        'HIGHLIGHT_CACHE': HIGHLIGHT_CACHE,
+        'ANALYSIS_CACHE': ANALYSIS_CACHE,
+        'STYLESHEET': STYLESHEET,
+        'GZIP': option('gzip', GZIP),
+        'GZIP_LEVEL': option('gzip_level', GZIP_LEVEL),
+        'TIMINGS': option('timings', TIMINGS),
+    }
+    if option('highlight_cache'):
+        settings['HIGHLIGHT_CACHE'] = HighlightCache(
+            opts.highlight_cache,
+            option('highlight_cache_size', 100) * 1024 * 1024)
+    if option('analysis_cache'):
+        settings['ANALYSIS_CACHE'] = AnalysisCache(
+            opts.analysis_cache,
+            option('analysis_cache_size', 10) * 1024 * 1024)
+    if option('external_stylesheet'):
+        settings['STYLESHEET'] = 'coverage.css'
+    return settings
+
+
+@contextlib.contextmanager
+def configured(settings):
+    """Set module settings for the duration of a ``with`` block.
+
+    ``settings`` maps names of module globals to values, like the result of
+    ``settings_from_options``.  The old values are restored afterwards.
+    """
+    module = globals()
+    saved = dict((name, module[name]) for name in settings)
+    module.update(settings)
+    try:
+        yield
+    finally:
+        module.update(saved)
 
 
 def make_coverage_reports(path, report_path, opts):
-    """Convert reports from ``path`` into HTML files in ``report_path``."""
+    """Convert reports from ``path`` into HTML files in ``report_path``.
+
+    ``path`` can also be a list of paths, whose coverage is merged (see
+    ``load_coverage``).
+
+    With a summary format in ``opts.format``, ``report_path`` is the name of
+    the file to write the summary to, or '-' for standard output.
+
+    The syntax highlighter, caches, stylesheet, compression and timings are
+    taken from ``opts`` as well (see ``settings_from_options``).  Options
+    added since ``opts`` only needed ``verbose``, ``strip_prefix`` and
+    ``path_alias`` have defaults, so that older callers keep working.
+    """
+    with configured(settings_from_options(opts)):
+        _make_coverage_reports(path, report_path, opts)
+
+
+def _make_coverage_reports(path, report_path, opts):
+    format = getattr(opts, 'format', 'html')
+    jobs = getattr(opts, 'jobs', 1)
+    batch_highlight = getattr(opts, 'batch_highlight', False)
+    paths = [path] if not isinstance(path, (list, tuple)) else list(path)
+    # Keep messages out of a summary on standard output.
+    log = sys.stderr if report_path == '-' else sys.stdout
     if opts.verbose:
-        print("Loading coverage reports from %s" % path)
+        print("Loading coverage reports from %s" % ', '.join(paths), file=log)
     tree = load_coverage(path, opts=opts)
+    if format in SUMMARY_FORMATS:
+        if report_path == '-':
+            write_summary(tree, sys.stdout, format)
+        else:
+            with open(report_path, 'w') as output:
+                write_summary(tree, output, format)
+        if ANALYSIS_CACHE is not None:
+            ANALYSIS_CACHE.prune()
+        if opts.verbose:
+            print("Wrote %s summary to %s" % (format.upper(), report_path),
+                  file=log)
+        return
     if opts.verbose:
         print(tree)
-    rev = get_svn_revision(os.path.join(path, os.path.pardir))
+    rev = get_revision(os.path.join(paths[0], os.path.pardir),
+                       getattr(opts, 'revision', None))
     timestamp = str(datetime.datetime.utcnow()) + "Z"
     footer = "Generated for revision {} on {}".format(rev, timestamp)
     create_report_path(report_path)
-    generate_htmls_from_tree(tree, path, report_path, footer)
-    generate_overall_html_from_tree(
-        tree, os.path.join(report_path, 'all.html'), footer)
+    if getattr(opts, 'single_page', False):
+        write_stylesheet(report_path, STYLESHEET or 'coverage.css')
+        generate_single_page_report(tree, report_path, footer, jobs=jobs,
+                                    batch_highlight=batch_highlight)
+    else:
+        write_stylesheet(report_path)
+        manifest = None
+        if getattr(opts, 'incremental', False):
+            manifest = ReportManifest(report_path, rev)
+        generate_htmls_from_tree(tree, path, report_path, footer, jobs=jobs,
+                                 batch_highlight=batch_highlight,
+                                 manifest=manifest)
+        if manifest is not None:
+            manifest.remove_old_pages()
+            manifest.save()
+        generate_overall_html_from_tree(
+            tree, os.path.join(report_path, 'all.html'), footer)
+    if HIGHLIGHT_CACHE is not None:
+        HIGHLIGHT_CACHE.prune()
+    if ANALYSIS_CACHE is not None:
+        ANALYSIS_CACHE.prune()
     if opts.verbose:
         print("Generated HTML files in %s" % report_path)
 
@@ -580,9 +2302,166 @@ def get_svn_revision(path):
     return rev
 
 
+def find_in_parents(path, name):
+    """Return the nearest directory at or above ``path`` containing ``name``.
+
+    Returns None if there is none.
+    """
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, name)):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def get_git_revision(path):
+    """Return the commit checked out in the git working tree of ``path``.
+
+    Reads HEAD and the refs from the .git directory, without running git.
+
+    Returns None if ``path`` is not in a git working tree, or HEAD cannot be
+    resolved.
+    """
+    top = find_in_parents(path, '.git')
+    if top is None:
+        return None
+    git_dir = os.path.join(top, '.git')
+    try:
+        if os.path.isfile(git_dir):
+            # Linked worktrees and submodules have a file pointing to the
+            # real git directory.
+            with open(git_dir) as file:
+                pointer = file.read().strip()
+            if not pointer.startswith('gitdir:'):
+                return None
+            git_dir = os.path.join(top, pointer[len('gitdir:'):].strip())
+        with open(os.path.join(git_dir, 'HEAD')) as file:
+            head = file.read().strip()
+    except (IOError, OSError):
+        return None
+    if not head.startswith('ref:'):
+        return head or None  # detached HEAD
+    return read_git_ref(git_dir, head[len('ref:'):].strip())
+
+
+def read_git_ref(git_dir, ref):
+    """Return the commit a git ref (e.g. 'refs/heads/master') points to.
+
+    Looks for the ref in its own file first, and then in packed-refs.
+
+    Returns None if the ref does not exist.
+    """
+    git_dirs = [git_dir]
+    try:
+        # Linked worktrees share the refs of the main git directory.
+        with open(os.path.join(git_dir, 'commondir')) as file:
+            git_dirs.append(os.path.join(git_dir, file.read().strip()))
+    except (IOError, OSError):
+        pass
+    for directory in git_dirs:
+        try:
+            with open(os.path.join(directory, *ref.split('/'))) as file:
+                return file.read().strip() or None
+        except (IOError, OSError):
+            pass
+    for directory in git_dirs:
+        try:
+            with open(os.path.join(directory, 'packed-refs')) as file:
+                for line in file:
+                    if line.startswith(('#', '^')):
+                        continue  # comments and peeled tags
+                    commit, _, name = line.strip().partition(' ')
+                    if name == ref:
+                        return commit
+        except (IOError, OSError):
+            pass
+    return None
+
+
+def get_svn_wc_revision(path):
+    """Return the revisions of the Subversion working copy of ``path``.
+
+    Reads the working copy database of Subversion 1.7 and newer, instead of
+    running svnversion, which looks at every file of the working copy.
+    Returns a revision number, or a range like '4168:4172' for a mixed
+    revision working copy, like svnversion, but does not notice local
+    modifications.  Older working copies fall back to ``get_svn_revision``.
+
+    Returns None if ``path`` is not in a Subversion working copy.
+    """
+    top = find_in_parents(path, '.svn')
+    if top is None:
+        return None
+    db = os.path.join(top, '.svn', 'wc.db')
+    if not os.path.isfile(db) or sqlite3 is None:
+        rev = get_svn_revision(path)
+        if isinstance(rev, bytes):
+            rev = rev.decode('ascii', 'replace')
+        return rev if rev != 'UNKNOWN' else None
+    query = ('SELECT MIN(revision), MAX(revision) FROM nodes'
+             ' WHERE op_depth = 0 AND revision IS NOT NULL')
+    relpath = os.path.relpath(os.path.abspath(path), top)
+    params = ()
+    if relpath != os.curdir:
+        relpath = relpath.replace(os.path.sep, '/')
+        query += ' AND (local_relpath = ? OR local_relpath LIKE ?)'
+        params = (relpath, relpath + '/%')
+    try:
+        connection = sqlite3.connect(db)
+        try:
+            low, high = connection.execute(query, params).fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+    if low is None:
+        return None
+    if low == high:
+        return str(low)
+    return '%d:%d' % (low, high)
+
+
+#: Environment variable with the revision to show in the report footer,
+#: e.g. set by a CI system.
+REVISION_ENV = 'COVERAGEREPORT_REVISION'
+
+#: Functions that return the revision of the working copy of a path, or
+#: None if it is not a working copy they know about, in the order in which
+#: they are tried.
+REVISION_PROVIDERS = [get_git_revision, get_svn_wc_revision]
+
+# The revisions found by get_revision, by directory.
+_revisions = {}
+
+
+def get_revision(path, revision=None):
+    """Return the revision of the working copy of ``path``, for the footer.
+
+    ``revision`` (e.g. from --revision), or else the REVISION_ENV
+    environment variable, overrides it.  Otherwise the functions in
+    REVISION_PROVIDERS are tried in turn, and the revision they find is
+    kept for later calls with the same path.
+
+    Returns "UNKNOWN" if none of them finds one.
+    """
+    revision = revision or os.environ.get(REVISION_ENV)
+    if revision:
+        return revision
+    path = os.path.abspath(path)
+    if path not in _revisions:
+        for provider in REVISION_PROVIDERS:
+            revision = provider(path)
+            if revision:
+                break
+        _revisions[path] = revision or "UNKNOWN"
+    return _revisions[path]
+
+
 def main(args=None):
     """Process command line arguments and produce HTML coverage reports."""
-
     parser = optparse.OptionParser(
         "usage: %prog [options] [inputpath [outputdir]]",
         description=(
@@ -590,7 +2469,10 @@ def main(args=None):
             ' omitted, it defaults to coverage or .coverage, whichever'
             ' exists.  If the output directory is omitted, it defaults to'
             ' inputpath + /report or ./coverage-reports, depending on whether'
-            ' the input path points to a directory or a file.'))
+            ' the input path points to a directory or a file.  The input'
+            ' path can be a glob pattern that matches several directories or'
+            ' several files, e.g. from parallel test runs, whose coverage is'
+            ' merged.'))
 
     parser.add_option('-q', '--quiet', help='be quiet',
                       action='store_const', const=0, dest='verbose')
@@ -604,6 +2486,84 @@ def main(args=None):
                       help=('define path mappings for filenames loaded '
                             'from .coverage'),
                       action='append')
+    parser.add_option('--merge', metavar='PATH', action='append',
+                      help=('merge the coverage from PATH (a directory, data '
+                            'file or glob pattern) with that from the input '
+                            'path; can be given several times'))
+    parser.add_option('--highlighter', metavar='NAME',
+                      choices=sorted(HIGHLIGHTERS), default=HIGHLIGHTER,
+                      help=('syntax highlighter for source code: %s '
+                            '(default: %s)' % (' or '.join(
+                                sorted(HIGHLIGHTERS)), HIGHLIGHTER)))
+    parser.add_option('--highlight-cache', metavar='DIR',
+                      help=('keep syntax-highlighted source code in DIR, '
+                            'and reuse it for unchanged modules'))
+    parser.add_option('--highlight-cache-size', metavar='MB', type='int',
+                      default=100,
+                      help=('limit the size of the highlight cache to MB '
+                            'megabytes (default: 100)'))
+    parser.add_option('--analysis-cache', metavar='DIR',
+                      help=('keep the statements of source files loaded '
+                            'from .coverage in DIR, and reuse them for '
+                            'unchanged files'))
+    parser.add_option('--analysis-cache-size', metavar='MB', type='int',
+                      default=10,
+                      help=('limit the size of the analysis cache to MB '
+                            'megabytes (default: 10)'))
+    parser.add_option('--batch-highlight', action='store_true',
+                      help=('run the syntax highlighter once for many '
+                            'modules instead of once for every module'))
+    parser.add_option('--highlight-batch-size', metavar='N', type='int',
+                      default=HIGHLIGHT_BATCH_SIZE,
+                      help=('with --batch-highlight, highlight at most N '
+                            'modules per run of the highlighter; smaller '
+                            'batches use less memory, but run it more often '
+                            '(default: %default)'))
+    parser.add_option('--external-stylesheet', action='store_true',
+                      help=('write the stylesheet to a separate file that '
+                            'all the HTML pages link to'))
+    parser.add_option('--single-page', action='store_true',
+                      help=('write a single HTML page that shows the '
+                            'coverage of all modules, instead of a page for '
+                            'every module and package'))
+    parser.add_option('--gzip', action='store_const', const='also',
+                      dest='gzip',
+                      help=('also write a gzip-compressed copy (.gz) of '
+                            'every file'))
+    parser.add_option('--gzip-only', action='store_const', const='only',
+                      dest='gzip',
+                      help='write only gzip-compressed files (.gz)')
+    parser.add_option('--gzip-level', metavar='N', type='int', default=9,
+                      help=('compression level for --gzip and --gzip-only, '
+                            'from 1 (fastest) to 9 (smallest, the default)'))
+    parser.add_option('--format', choices=('html',) + SUMMARY_FORMATS,
+                      default='html',
+                      help=('output format: html (the default), or json or '
+                            'csv for writing only the coverage statistics '
+                            'of every module and package to the output '
+                            'file, or to standard output if it is omitted '
+                            'or -'))
+    parser.add_option('--incremental', action='store_true',
+                      help=('only write HTML pages whose input has changed '
+                            'since the last run'))
+    parser.add_option('-j', '--jobs', metavar='N', type='int', default=1,
+                      help=('use N worker threads for reading .cover '
+                            'files, and N worker processes for analyzing '
+                            'coverage.py data and writing the HTML pages '
+                            '(default: 1)'))
+    parser.add_option('--revision', metavar='REV',
+                      help=('revision to show in the footer of the report, '
+                            'instead of the one of the git or Subversion '
+                            'working copy of the input (or set %s)'
+                            % REVISION_ENV))
+    parser.add_option('--slowest', metavar='N', type='int',
+                      help=('print the time spent in every phase of the '
+                            'run, and on the N slowest pages'))
+    parser.add_option('--profile-out', metavar='FILE',
+                      help=('write the time spent in every phase and on the '
+                            'slowest pages to FILE, as JSON if its name ends '
+                            'with .json, or else cProfile statistics of the '
+                            'main process (see the pstats module)'))
 
     if args is None:
         args = sys.argv[1:]
@@ -620,6 +2580,8 @@ def main(args=None):
 
     if len(args) > 1:
         report_path = args[1]
+    elif opts.format in SUMMARY_FORMATS:
+        report_path = '-'
     else:
         if os.path.isdir(path):
             # backward compat: default input path is 'coverage', default output
@@ -631,7 +2593,30 @@ def main(args=None):
     if len(args) > 2:
         parser.error("too many arguments")
 
-    make_coverage_reports(path, report_path, opts=opts)
+    paths = expand_paths([path] + (opts.merge or []))
+    if len(paths) > 1:
+        path = paths
+    else:
+        path = paths[0]
+
+    json_profile = (opts.profile_out or '').endswith('.json')
+    if opts.slowest is not None or json_profile:
+        opts.timings = Timings()
+    else:
+        opts.timings = None
+
+    if opts.profile_out and not json_profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(make_coverage_reports, path, report_path, opts=opts)
+        profiler.dump_stats(opts.profile_out)
+    else:
+        make_coverage_reports(path, report_path, opts=opts)
+    if opts.slowest is not None:
+        # Keep the timings out of a summary on standard output.
+        opts.timings.report(
+            sys.stderr if report_path == '-' else sys.stdout, opts.slowest)
+    if json_profile:
+        opts.timings.write_json(opts.profile_out, opts.slowest or 10)
 
 
 if __name__ == '__main__':
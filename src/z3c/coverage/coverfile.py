@@ -0,0 +1,291 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Parser for the .cover files that Python's trace.py produces.
+
+Every line of a .cover file starts with a prefix of seven characters:
+
+- ``'>>>>>> '`` for statements that were never executed,
+- ``'%5d: '`` with the execution count for statements that were executed,
+- seven spaces for lines that are not statements.
+
+The annotated source code that coveragereport makes from coverage.py data
+uses the same format, with ``'     # '`` for statements that are excluded
+from coverage; they are counted as lines that are not statements.
+
+The files are parsed as bytes, so their encoding does not matter, and
+statements are counted with bytes.count() instead of a loop over the lines
+in Python.  Large files are memory-mapped instead of read.
+
+The .cover files of the same module from several test runs (e.g. shards
+of a test suite) can be merged into one.
+"""
+
+import mmap
+import operator
+import os
+import re
+
+try:
+    from itertools import zip_longest
+except ImportError:  # pragma: nocover
+    from itertools import izip_longest as zip_longest
+
+
+#: Files at least this big (in bytes) are memory-mapped.
+MMAP_THRESHOLD = 1024 * 1024
+
+#: Size of the parts in which memory-mapped files are parsed.
+CHUNK_SIZE = 1024 * 1024
+
+#: Status of lines that were executed.
+COVERED = 'covered'
+
+#: Status of lines that were never executed.
+MISSING = 'missing'
+
+#: Status of lines that are not statements.
+NOT_CODE = None
+
+#: Prefix of lines that are excluded from coverage (not made by trace.py).
+EXCLUDED_PREFIX = b'     # '
+
+# Lines with fewer than seven characters (counting the newline) have no
+# coverage prefix.  This finds them, except for the first and last line.
+SHORT_LINE_RE = re.compile(br'\n[^\n]{0,5}(?=\n)')
+# The same, but much faster, and it misses some of them if there are
+# several in a row.  Good enough for finding out whether there are any.
+ANY_SHORT_LINE_RE = re.compile(br'\n[^\n]{0,5}\n')
+
+# The prefix of an executed statement, with its execution count.
+EXECUTED_PREFIX_RE = re.compile(br' *(\d+): ')
+
+
+def count_coverage(data):
+    r"""Count the covered and uncovered statements in a .cover file.
+
+    ``data`` is the contents of the file, as bytes.
+
+        >>> count_coverage(b'       # comment\n'
+        ...                b'    2: import os\n'
+        ...                b'>>>>>> os.unlink(x)\n'
+        ...                b'     # raise AssertionError\n')
+        (1, 1)
+
+    Returns a (covered, uncovered) tuple.
+    """
+    if not len(data):
+        return 0, 0
+    # Every line but the first one follows a newline, so lines can be
+    # counted by their prefix with bytes.count(), without looking at
+    # every line in Python.
+    lines = data.count(b'\n') + 1
+    uncovered = data.count(b'\n>>>>>>')
+    not_code = data.count(b'\n' + b' ' * 7)
+    not_code += data.count(b'\n' + EXCLUDED_PREFIX)
+    if ANY_SHORT_LINE_RE.search(data):
+        not_code += sum(1 for match in SHORT_LINE_RE.finditer(data))
+    first = data[:7]
+    if first.startswith(b'>>>>>>') and len(first) == 7:
+        uncovered += 1
+    elif (first == b' ' * 7 or first == EXCLUDED_PREFIX
+          or b'\n' in first[:6] or len(first) < 7):
+        not_code += 1
+    last_newline = data.rfind(b'\n')
+    if last_newline == len(data) - 1:
+        lines -= 1  # there is no last line after the final newline
+    elif last_newline != -1 and len(data) - last_newline - 1 < 7:
+        # The last line has no newline, and is too short.
+        if data[last_newline + 1:].startswith(b'>>>>>>'):
+            uncovered -= 1
+        not_code += 1
+    return lines - not_code - uncovered, uncovered
+
+
+def parse_lines(data):
+    r"""Find the coverage status of every line in a .cover file.
+
+    ``data`` is the contents of the file, as bytes.
+
+        >>> for line in parse_lines(b'       # comment\n'
+        ...                         b'    2: import os\n'
+        ...                         b'>>>>>> os.unlink(x)\n'
+        ...                         b'     # raise AssertionError\n'):
+        ...     print(line)
+        (None, None)
+        ('covered', 2)
+        ('missing', 0)
+        (None, None)
+
+    Returns a list with a (status, hits) tuple for every line.  ``status``
+    is COVERED, MISSING or NOT_CODE, and ``hits`` is the number of times
+    the line was executed, or None if that is not known.  Lines with the
+    same prefix share the same tuple.
+    """
+    lines = data.split(b'\n')
+    if not lines[-1]:
+        del lines[-1]  # there is no last line after the final newline
+    elif len(lines[-1]) < 7:
+        # The last line has no newline, so it needs one more character to
+        # have a coverage prefix.
+        lines[-1] = b''
+    # There are few different prefixes, so each of them is only looked at
+    # once, and the loop over the lines runs in C.
+    return list(map(LineStatuses().__getitem__, map(_prefix, lines)))
+
+
+_prefix = operator.itemgetter(slice(0, 7))
+
+
+class LineStatuses(dict):
+    """The (status, hits) of lines by their coverage prefix.
+
+    The status is computed the first time a prefix is looked up.
+    """
+
+    def __missing__(self, prefix):
+        if (len(prefix) < 6 or prefix == b' ' * 7
+                or prefix == EXCLUDED_PREFIX):
+            status = (NOT_CODE, None)
+        elif prefix.startswith(b'>>>>>>'):
+            status = (MISSING, 0)
+        else:
+            try:
+                hits = int(prefix[:5])
+            except ValueError:
+                hits = None
+            status = (COVERED, hits)
+        self[prefix] = status
+        return status
+
+
+def count_file(filename):
+    """Count the covered and uncovered statements in a .cover file.
+
+    Returns a (covered, uncovered) tuple.
+    """
+    covered = uncovered = 0
+    for data in read_chunks(filename):
+        chunk_covered, chunk_uncovered = count_coverage(data)
+        covered += chunk_covered
+        uncovered += chunk_uncovered
+    return covered, uncovered
+
+
+def parse_file(filename):
+    """Find the coverage status of every line in a .cover file.
+
+    Returns a list of (status, hits) tuples, like ``parse_lines``.
+    """
+    lines = []
+    for data in read_chunks(filename):
+        lines.extend(parse_lines(data))
+    return lines
+
+
+def merge_lines(files):
+    r"""Merge the lines of several .cover files of the same module.
+
+    ``files`` are iterables of lines (as bytes), such as files opened in
+    binary mode.  They are read in step, a line at a time, so they must all
+    be made from the same source code.  A line was executed as many times as
+    in all the files together, and is only missing if it was not executed
+    in any of them:
+
+        >>> lines = list(merge_lines([[b'    2: import os\n',
+        ...                               b'>>>>>> os.unlink(x)\n',
+        ...                               b'>>>>>> os.rmdir(y)\n'],
+        ...                              [b'    1: import os\n',
+        ...                               b'    1: os.unlink(x)\n',
+        ...                               b'>>>>>> os.rmdir(y)\n']]))
+        >>> for line in parse_lines(b''.join(lines)):
+        ...     print(line)
+        ('covered', 3)
+        ('covered', 1)
+        ('missing', 0)
+        >>> print(lines[0].decode().strip())
+        3: import os
+
+    Lines that are not statements, like excluded statements and lines too
+    short for a coverage prefix, are taken from the first file as they are:
+
+        >>> lines = [b'     # raise X\n', b'  pass\n']
+        >>> list(merge_lines([lines, lines])) == lines
+        True
+
+    Yields the merged lines.
+    """
+    for lines in zip_longest(*files, fillvalue=b''):
+        hits = 0
+        executed = missing = False
+        text = None
+        for line in lines:
+            match = EXECUTED_PREFIX_RE.match(line)
+            if match and match.end() >= 7:
+                executed = True
+                hits += int(match.group(1))
+                start = match.end()
+            elif line.startswith(b'>>>>>>'):
+                missing = True
+                start = 7 if line[6:7] == b' ' else 6
+            else:
+                # Not a statement, or too short for a coverage prefix.
+                continue
+            if text is None:
+                text = line[start:]
+        if executed:
+            yield ('%5d: ' % hits).encode('ascii') + text
+        elif missing:
+            yield b'>>>>>> ' + text
+        else:
+            yield next((line for line in lines if line), b'')
+
+
+def merge_files(filenames):
+    """Merge several .cover files of the same module (see ``merge_lines``).
+
+    The files are read a line at a time.
+
+    Returns the contents of the merged file, as bytes.
+    """
+    files = []
+    try:
+        for filename in filenames:
+            files.append(open(filename, 'rb'))
+        return b''.join(merge_lines(files))
+    finally:
+        for file in files:
+            file.close()
+
+
+def read_chunks(filename):
+    """Read a .cover file in chunks of whole lines.
+
+    Files of at least MMAP_THRESHOLD bytes are memory-mapped and returned
+    in chunks of about CHUNK_SIZE bytes.  Smaller files are returned in a
+    single chunk.
+    """
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < MMAP_THRESHOLD or size == 0:
+            yield file.read()
+            return
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = data.find(b'\n', start + CHUNK_SIZE) + 1 or size
+                yield data[start:end]
+                start = end
+        finally:
+            data.close()
@@ -20,7 +20,7 @@ from z3c.coverage import coveragereport
 from z3c.coverage.coveragereport import (
     Lazy, CoverageNode, CoverageCoverageNode, index_to_nice_name,
     index_to_name, percent_to_colour, traverse_tree_in_order,
-    get_svn_revision, syntax_highlight)
+    get_svn_revision, syntax_highlight, highlight_uncovered_lines)
 
 
 def doctest_Lazy():
@@ -162,6 +162,349 @@ def doctests_CoverageCoverageNode_annotated_source():
     """
 
 
+def doctest_baseline_entry_excluded_lines():
+    """Test for coveragediff.baseline_entry with coverage.py data
+
+    Lines that are excluded from coverage are not code, so the baseline
+    counts the same lines as the module's coverage
+
+        >>> from z3c.coverage import coveragediff
+        >>> node = CoverageCoverageNode(FakeCoverage(), SAMPLE_PY)
+        >>> module = coveragediff.ModuleCoverage(
+        ...     'sample', node.covered, node.uncovered, node)
+        >>> entry = coveragediff.baseline_entry(module)
+        >>> entry['covered'], entry['uncovered']
+        (2, 1)
+        >>> tuple(module)
+        (2, 1)
+        >>> [n for n, code in enumerate(
+        ...     coveragediff.unpack_bits(entry['code'], entry['lines']), 1)
+        ...  if code]
+        [4, 5, 8]
+
+    """
+
+
+def doctest_create_tree_from_files_jobs():
+    """Test for get_file_list and create_tree_from_files
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-input-')
+        >>> inputDir = os.path.join(tempDir, 'coverage')
+        >>> shutil.copytree(os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput'),
+        ...     inputDir) and None
+        >>> os.mkdir(os.path.join(inputDir, 'z3c.coverage.subdir.cover'))
+
+    get_file_list() skips directories
+
+        >>> filelist = coveragereport.get_file_list(
+        ...     inputDir, coveragereport.filter_fn)
+        >>> for filename in sorted(filelist):
+        ...     print(filename)
+        z3c.coverage.__init__.cover
+        z3c.coverage.coveragediff.cover
+        z3c.coverage.coveragereport.cover
+
+    The files can be read by a pool of threads.  The tree is the same as
+    when they are read one after the other
+
+        >>> tree = coveragereport.create_tree_from_files(
+        ...     filelist, inputDir, jobs=2)
+        >>> for name, node in sorted(tree['z3c']['coverage'].items()):
+        ...     print('%s: %s' % (name, node))
+        __init__: 100% covered (0 of 1 lines uncovered)
+        coveragediff: 52% covered (78 of 164 lines uncovered)
+        coveragereport: 17% covered (161 of 196 lines uncovered)
+
+        >>> serial = coveragereport.create_tree_from_files(filelist, inputDir)
+        >>> ([(name, str(node))
+        ...   for name, node in serial['z3c']['coverage'].items()] ==
+        ...  [(name, str(node))
+        ...   for name, node in tree['z3c']['coverage'].items()])
+        True
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_create_tree_from_coverage_jobs():
+    """Test for create_tree_from_coverage
+
+    Analyzing the measured files with coverage.py can be spread over several
+    worker processes, which load the coverage data themselves
+
+        >>> import coverage
+        >>> here = os.path.dirname(z3c.coverage.__file__)
+        >>> path_aliases = [
+        ...     '/home/mg/src/zopefoundation/z3c.coverage/src/z3c/coverage=%s'
+        ...     % here]
+        >>> def load(jobs):
+        ...     cov = coverage.coverage(
+        ...         data_file=os.path.join(here, 'sampleinput.coverage'),
+        ...         config_file=False)
+        ...     cov.load()
+        ...     return coveragereport.create_tree_from_coverage(
+        ...         cov, strip_prefix=os.path.dirname(os.path.dirname(here)),
+        ...         path_aliases=path_aliases, jobs=jobs)
+
+        >>> tree = load(jobs=2)
+        >>> for name, node in sorted(tree['z3c']['coverage'].items()):
+        ...     print('%s: %s' % (name, node))  # doctest: +ELLIPSIS
+        __init__: 100% covered (0 of 0 lines uncovered)
+        coveragediff: ...% covered (... of ... lines uncovered)
+        coveragereport: ...% covered (... of ... lines uncovered)
+
+    The result is the same as when the files are analyzed one by one
+
+        >>> def summary(tree):
+        ...     package = tree['z3c']['coverage']
+        ...     return sorted((name, node._statements, node._excluded,
+        ...                    node._missing)
+        ...                   for name, node in package.items())
+        >>> summary(tree) == summary(load(jobs=1))
+        True
+
+    """
+
+
+def doctest_merge_shards():
+    r"""Test for merging the coverage of several test runs
+
+    Test suites that run in several parallel shards write a directory of
+    .cover files for every shard.  The files of the same module are merged
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> def write(shard, filename, text):
+        ...     if not os.path.isdir(os.path.join(tempDir, shard)):
+        ...         os.mkdir(os.path.join(tempDir, shard))
+        ...     with open(os.path.join(tempDir, shard, filename), 'w') as f:
+        ...         f.write(text)
+        >>> write('shard1', 'pkg.a.cover',
+        ...       '    1: def f(x):\n'
+        ...       '    1:     if x:\n'
+        ...       '>>>>>>         return 1\n'
+        ...       '    1:     return 2\n')
+        >>> write('shard2', 'pkg.a.cover',
+        ...       '    1: def f(x):\n'
+        ...       '    2:     if x:\n'
+        ...       '    2:         return 1\n'
+        ...       '>>>>>>     return 2\n')
+        >>> write('shard2', 'pkg.b.cover',
+        ...       '>>>>>> import os\n')
+
+        >>> from z3c.coverage import coverfile
+        >>> merge_files_orig = coverfile.merge_files
+        >>> def merge_files(filenames):
+        ...     print('merging %s' % ', '.join(
+        ...         '/'.join(filename.split(os.sep)[-2:])
+        ...         for filename in filenames))
+        ...     return merge_files_orig(filenames)
+        >>> coverfile.merge_files = merge_files
+
+        >>> class opts:
+        ...     jobs = 1
+        >>> tree = coveragereport.load_coverage(
+        ...     [os.path.join(tempDir, 'shard1'),
+        ...      os.path.join(tempDir, 'shard2')], opts)
+        merging shard1/pkg.a.cover, shard2/pkg.a.cover
+        >>> for name, node in sorted(tree['pkg'].items()):
+        ...     print('%s: %s' % (name, node))
+        a: 100% covered (0 of 4 lines uncovered)
+        b: 0% covered (1 of 1 lines uncovered)
+
+    The merged file is kept for the page of the module
+
+        >>> print(tree['pkg']['a'].get_cover_text())
+            2: def f(x):
+            3:     if x:
+            2:         return 1
+            1:     return 2
+        <BLANKLINE>
+        >>> coverfile.merge_files = merge_files_orig
+
+    The command line takes glob patterns
+
+        >>> coveragereport.main(
+        ...     [os.path.join(tempDir, 'shard*'), '--format=csv', '--quiet'])
+        name,type,covered,total,percent
+        everything,package,4,5,80
+        pkg,package,4,5,80
+        pkg.a,module,4,4,100
+        pkg.b,module,0,1,0
+
+    Directories of .cover files and coverage.py data cannot be merged
+
+        >>> coveragereport.load_coverage(  # doctest: +NORMALIZE_WHITESPACE
+        ...     [os.path.join(tempDir, 'shard1'),
+        ...      os.path.join(os.path.dirname(z3c.coverage.__file__),
+        ...                   'sampleinput.coverage')], opts)
+        Traceback (most recent call last):
+          ...
+        ValueError: cannot merge directories of .cover files with
+        coverage.py data files
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_merge_coverage_data():
+    """Test for merge_coverage_data
+
+    The data files of several test runs are merged in memory
+
+        >>> from coverage.data import CoverageData
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> sample = os.path.join(os.path.dirname(z3c.coverage.__file__),
+        ...                       'sample.py')
+        >>> data_files = []
+        >>> init = os.path.join(os.path.dirname(z3c.coverage.__file__),
+        ...                     '__init__.py')
+        >>> for n, lines in enumerate([[4], [5]]):
+        ...     data = CoverageData()
+        ...     data.add_lines({sample: dict.fromkeys(lines),
+        ...                     init: dict.fromkeys([1])})
+        ...     data_files.append(os.path.join(tempDir, '.coverage.%d' % n))
+        ...     data.write_file(data_files[-1])
+
+        >>> cov = coveragereport.merge_coverage_data(data_files)
+        >>> sorted(cov.data.lines(sample))
+        [4, 5]
+        >>> sorted(os.listdir(tempDir))
+        ['.coverage.0', '.coverage.1']
+
+    Analysis workers merge the data files too
+
+        >>> tree = coveragereport.create_tree_from_coverage(
+        ...     cov, strip_prefix=os.path.dirname(os.path.dirname(
+        ...         os.path.dirname(z3c.coverage.__file__))),
+        ...     jobs=2, data_files=data_files)
+        >>> node = tree['z3c']['coverage']['sample']
+        >>> node._missing == coveragereport.create_tree_from_coverage(
+        ...     cov, strip_prefix=os.path.dirname(os.path.dirname(
+        ...         os.path.dirname(z3c.coverage.__file__)))
+        ...     )['z3c']['coverage']['sample']._missing
+        True
+        >>> 4 in node._missing or 5 in node._missing
+        False
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_AnalysisCache():
+    """Test for AnalysisCache
+
+    The statements found in source files can be kept in a cache, so that
+    unchanged files need not be parsed again
+
+        >>> import coverage
+        >>> from z3c.coverage.coveragereport import AnalysisCache
+        >>> here = os.path.dirname(z3c.coverage.__file__)
+        >>> cov = coverage.coverage(
+        ...     data_file=os.path.join(here, 'sampleinput.coverage'),
+        ...     config_file=False)
+        >>> cov.load()
+        >>> coveragereport.apply_path_aliases(cov, {
+        ...     '/home/mg/src/zopefoundation/z3c.coverage/src/z3c/coverage':
+        ...     here})
+        >>> filenames = sorted(cov.data.measured_files())
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-cache-')
+        >>> settings = {'ANALYSIS_CACHE': AnalysisCache(tempDir)}
+
+        >>> find_statements_orig = coveragereport.find_statements
+        >>> def find_statements(cov, filename, nlines):
+        ...     print('parsing %s' % os.path.basename(filename))
+        ...     return find_statements_orig(cov, filename, nlines)
+        >>> coveragereport.find_statements = find_statements
+
+        >>> with coveragereport.configured(settings):
+        ...     analyses = [coveragereport.analyze_coverage_file(cov, filename)
+        ...                 for filename in filenames]
+        parsing __init__.py
+        parsing coveragediff.py
+        parsing coveragereport.py
+        parsing tests.py
+        >>> with coveragereport.configured(settings):
+        ...     cached = [coveragereport.analyze_coverage_file(cov, filename)
+        ...               for filename in filenames]
+        >>> cached == analyses
+        True
+
+    The result is the same as that of coverage.py's own analysis
+
+        >>> [coveragereport.analyze_coverage_file(cov, filename)
+        ...  for filename in filenames] == analyses
+        True
+
+    Finding the statements needs a private method of coverage.py.  Versions
+    of coverage.py that lack it are analyzed without the cache
+
+        >>> class OtherCoverage(object):
+        ...     data = cov.data
+        ...     get_option = cov.get_option
+        ...     analysis2 = cov.analysis2
+        >>> print(find_statements_orig(OtherCoverage(), filenames[0], 1))
+        None
+        >>> shutil.rmtree(tempDir)
+        >>> coveragereport.find_statements = find_statements_orig
+        >>> settings = {'ANALYSIS_CACHE': AnalysisCache(tempDir)}
+        >>> with coveragereport.configured(settings):
+        ...     [coveragereport.analyze_coverage_file(
+        ...         OtherCoverage(), filename)
+        ...      for filename in filenames] == analyses
+        True
+        >>> os.path.exists(tempDir)
+        False
+
+    """
+
+
+def doctest_coverfile():
+    """Test for coverfile.count_file and coverfile.parse_file
+
+        >>> from z3c.coverage import coverfile
+        >>> filename = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput',
+        ...     'z3c.coverage.coveragediff.cover')
+        >>> coverfile.count_file(filename)
+        (86, 78)
+
+    The per-line status agrees with the counts
+
+        >>> lines = coverfile.parse_file(filename)
+        >>> len(lines)
+        346
+        >>> (sum(1 for status, hits in lines if status == coverfile.COVERED),
+        ...  sum(1 for status, hits in lines if status == coverfile.MISSING))
+        (86, 78)
+        >>> lines[:3]
+        [(None, None), (None, None), (None, None)]
+        >>> [line for line in lines if line[0]][:3]
+        [('covered', 1), ('covered', 1), ('covered', 1)]
+
+    Large files are memory-mapped and parsed in chunks, with the same
+    results
+
+        >>> threshold_orig = coverfile.MMAP_THRESHOLD
+        >>> chunk_size_orig = coverfile.CHUNK_SIZE
+        >>> coverfile.MMAP_THRESHOLD = 0
+        >>> coverfile.CHUNK_SIZE = 1000
+        >>> len(list(coverfile.read_chunks(filename)))
+        14
+        >>> coverfile.count_file(filename)
+        (86, 78)
+        >>> coverfile.parse_file(filename) == lines
+        True
+        >>> coverfile.MMAP_THRESHOLD = threshold_orig
+        >>> coverfile.CHUNK_SIZE = chunk_size_orig
+
+    """
+
+
 def doctest_index_to_nice_name():
     """Test for index_to_nice_name
 
@@ -230,6 +573,503 @@ def doctest_traverse_tree_in_order():
     """
 
 
+def doctest_deep_tree():
+    """Test for compute_totals and traverse_tree
+
+    Trees can be deeper than the recursion limit
+
+        >>> depth = sys.getrecursionlimit() + 100
+        >>> root = CoverageNode()
+        >>> leaf = CoverageNode()
+        >>> leaf.covered, leaf.total = 3, 4
+        >>> root.set_at(['p%d' % n for n in range(depth)], leaf)
+        >>> other = CoverageNode()
+        >>> other.covered, other.total = 1, 4
+        >>> root.set_at(['p0', 'other'], other)
+
+    compute_totals() computes the statistics of all packages in one pass
+
+        >>> coveragereport.compute_totals(root)
+        >>> print(root)
+        50% covered (4 of 8 lines uncovered)
+        >>> print(root['p0']['p1'])
+        75% covered (1 of 4 lines uncovered)
+
+    and the tree can be traversed
+
+        >>> paths = []
+        >>> coveragereport.traverse_tree(
+        ...     root, [], lambda node, index: paths.append(index))
+        >>> len(paths) == depth + 2
+        True
+        >>> paths[:3]
+        [[], ['p0'], ['p0', 'p1']]
+        >>> paths[-1]
+        ['p0', 'other']
+
+    The statistics of a node that has children of its own are added to
+    theirs
+
+        >>> root = CoverageNode()
+        >>> module = CoverageNode()
+        >>> module.covered, module.total = 2, 2
+        >>> root.set_at(['p', 'm'], module)
+        >>> sub = CoverageNode()
+        >>> sub.covered, sub.total = 1, 4
+        >>> root.set_at(['p', 'm', 'sub'], sub)
+        >>> coveragereport.compute_totals(root)
+        >>> print(root['p']['m'])
+        50% covered (3 of 6 lines uncovered)
+        >>> print(root)
+        50% covered (3 of 6 lines uncovered)
+
+    """
+
+
+def doctest_generate_htmls_from_tree_visits_each_node_once():
+    """Test for generate_htmls_from_tree
+
+    Every page lists the parents and the direct children of its node.  These
+    are found without traversing the whole tree again for every page, so
+    the number of visited nodes grows linearly with the size of the tree.
+
+        >>> root = CoverageNode()
+        >>> for name in ['a.b.c', 'a.b.d', 'a.e', 'f.g', 'f.h', 'f.i.j']:
+        ...     leaf = CoverageNode()
+        ...     leaf.covered, leaf.total = 1, 2
+        ...     root.set_at(name.split('.'), leaf)
+
+        >>> visits = []
+        >>> traverse_tree_orig = coveragereport.traverse_tree
+        >>> def counting_traverse_tree(tree, index, function):
+        ...     def counting_function(node, index):
+        ...         visits.append(index)
+        ...         function(node, index)
+        ...     traverse_tree_orig(tree, index, counting_function)
+        >>> coveragereport.traverse_tree = counting_traverse_tree
+
+        >>> def generate_html_stub(output_filename, tree, my_index, info,
+        ...                        path, footer, nodes, row_cache):
+        ...     print('%s: %s' % (index_to_name(my_index), ', '.join(
+        ...         '%s (%s)' % (index_to_name(node_path),
+        ...                      nodes[tuple(node_path)].uncovered)
+        ...         for node_path in info)))
+        >>> generate_html_orig = coveragereport.generate_html
+        >>> coveragereport.generate_html = generate_html_stub
+
+        >>> coveragereport.generate_htmls_from_tree(
+        ...     root, 'coverage', 'reports')  # doctest: +NORMALIZE_WHITESPACE
+        a: everything (6), a (3), a.b (2), a.e (1)
+        a.b: everything (6), a (3), a.b (2), a.b.c (1), a.b.d (1)
+        a.b.c: everything (6), a (3), a.b (2), a.b.c (1)
+        a.b.d: everything (6), a (3), a.b (2), a.b.d (1)
+        a.e: everything (6), a (3), a.e (1)
+        f: everything (6), f (3), f.g (1), f.h (1), f.i (1)
+        f.g: everything (6), f (3), f.g (1)
+        f.h: everything (6), f (3), f.h (1)
+        f.i: everything (6), f (3), f.i (1), f.i.j (1)
+        f.i.j: everything (6), f (3), f.i (1), f.i.j (1)
+
+    The tree has 11 nodes (including the root), and each of them was visited
+    exactly once
+
+        >>> len(visits)
+        11
+
+        >>> coveragereport.traverse_tree = traverse_tree_orig
+        >>> coveragereport.generate_html = generate_html_orig
+
+    """
+
+
+def doctest_generate_htmls_from_tree_jobs():
+    """Test for generate_htmls_from_tree with worker processes
+
+    Pages can be written by a pool of worker processes.  The output is
+    exactly the same as when all the pages are written by a single process.
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> filelist = coveragereport.get_file_list(
+        ...     inputDir, coveragereport.filter_fn)
+        >>> tree = coveragereport.create_tree_from_files(filelist, inputDir)
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> serialDir = os.path.join(tempDir, 'serial')
+        >>> parallelDir = os.path.join(tempDir, 'parallel')
+        >>> os.mkdir(serialDir)
+        >>> os.mkdir(parallelDir)
+
+        >>> coveragereport.generate_htmls_from_tree(
+        ...     tree, inputDir, serialDir, 'footer')
+        >>> coveragereport.generate_htmls_from_tree(
+        ...     tree, inputDir, parallelDir, 'footer', jobs=2)
+
+        >>> def read(filename):
+        ...     with open(filename, 'rb') as f:
+        ...         return f.read()
+        >>> sorted(os.listdir(serialDir)) == sorted(os.listdir(parallelDir))
+        True
+        >>> for filename in sorted(os.listdir(serialDir)):
+        ...     print(filename, read(os.path.join(serialDir, filename)) ==
+        ...                     read(os.path.join(parallelDir, filename)))
+        z3c.coverage.__init__.html True
+        z3c.coverage.coveragediff.html True
+        z3c.coverage.coveragereport.html True
+        z3c.coverage.html True
+        z3c.html True
+
+        >>> shutil.rmtree(tempDir)
+
+    Worker processes get detached copies of the nodes, without any
+    children
+
+        >>> tree['z3c'].detach()
+        {}
+        >>> tree['z3c'].detach().covered == tree['z3c'].covered
+        True
+
+    """
+
+
+def doctest_generate_htmls_from_tree_incremental():
+    """Test for generate_htmls_from_tree with a ReportManifest
+
+    The manifest in the report directory remembers the inputs of every
+    page, so that pages that have not changed need not be written again.
+
+        >>> from z3c.coverage.coveragereport import ReportManifest
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> inputDir = os.path.join(tempDir, 'coverage')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> shutil.copytree(os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput'),
+        ...     inputDir) and None
+        >>> os.mkdir(outputDir)
+
+        >>> write_html_orig = coveragereport.write_html
+        >>> def write_html(output_filename, my_index, rows, node, footer):
+        ...     print('writing %s%s' % (
+        ...         os.path.basename(output_filename),
+        ...         ' (old source)' if 'html_source' in node.__dict__ else ''))
+        ...     write_html_orig(output_filename, my_index, rows, node, footer)
+        >>> coveragereport.write_html = write_html
+
+        >>> def generate(revision='1', **settings):
+        ...     filelist = sorted(coveragereport.get_file_list(
+        ...         inputDir, coveragereport.filter_fn))
+        ...     tree = coveragereport.create_tree_from_files(
+        ...         filelist, inputDir)
+        ...     with coveragereport.configured(settings):
+        ...         manifest = ReportManifest(outputDir, revision)
+        ...         coveragereport.generate_htmls_from_tree(
+        ...             tree, inputDir, outputDir, manifest=manifest)
+        ...     manifest.remove_old_pages()
+        ...     manifest.save()
+
+    The first time, all the pages are written
+
+        >>> generate()
+        writing z3c.html
+        writing z3c.coverage.html
+        writing z3c.coverage.__init__.html
+        writing z3c.coverage.coveragediff.html
+        writing z3c.coverage.coveragereport.html
+
+    The next time, nothing has changed
+
+        >>> generate()
+
+    If the source code of a module changes, but its coverage numbers stay
+    the same, only the page of that module is written
+
+        >>> filename = os.path.join(inputDir, 'z3c.coverage.__init__.cover')
+        >>> with open(filename, 'a') as f:
+        ...     _ = f.write('       # a comment\\n')
+        >>> generate()
+        writing z3c.coverage.__init__.html
+
+    If the coverage numbers change, the pages that show them are written too.
+    The source code of the pages whose module has not changed is taken from
+    the old pages instead of being highlighted again
+
+        >>> with open(filename, 'a') as f:
+        ...     _ = f.write('>>>>>> pass\\n')
+        >>> generate()
+        writing z3c.html (old source)
+        writing z3c.coverage.html (old source)
+        writing z3c.coverage.__init__.html
+        writing z3c.coverage.coveragediff.html (old source)
+        writing z3c.coverage.coveragereport.html (old source)
+
+        >>> from z3c.coverage.coveragereport import read_html_source
+        >>> (read_html_source(os.path.join(outputDir,
+        ...                                'z3c.coverage.coveragediff.html'))
+        ...  == coveragereport.TraceCoverageNode(os.path.join(
+        ...      inputDir, 'z3c.coverage.coveragediff.cover')).html_source)
+        True
+
+    Pages that are missing are written again
+
+        >>> os.unlink(os.path.join(outputDir, 'z3c.coverage.html'))
+        >>> generate()
+        writing z3c.coverage.html
+
+    Changing the syntax highlighter changes all pages
+
+        >>> generate(HIGHLIGHTER='python')
+        writing z3c.html
+        writing z3c.coverage.html
+        writing z3c.coverage.__init__.html
+        writing z3c.coverage.coveragediff.html
+        writing z3c.coverage.coveragereport.html
+
+    So does a new revision, which is shown in the footer of every page
+
+        >>> generate(revision='2')
+        writing z3c.html
+        writing z3c.coverage.html
+        writing z3c.coverage.__init__.html
+        writing z3c.coverage.coveragediff.html
+        writing z3c.coverage.coveragereport.html
+
+    The pages of modules that no longer have coverage data are removed.
+    The other pages link to them in their index, so they are written too
+
+        >>> os.unlink(os.path.join(inputDir,
+        ...                        'z3c.coverage.coveragediff.cover'))
+        >>> generate(revision='2')
+        writing z3c.html (old source)
+        writing z3c.coverage.html (old source)
+        writing z3c.coverage.__init__.html (old source)
+        writing z3c.coverage.coveragereport.html (old source)
+        >>> sorted(os.listdir(outputDir))  # doctest: +NORMALIZE_WHITESPACE
+        ['manifest.json', 'z3c.coverage.__init__.html',
+         'z3c.coverage.coveragereport.html', 'z3c.coverage.html', 'z3c.html']
+
+        >>> coveragereport.write_html = write_html_orig
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_make_coverage_reports_old_options():
+    """Test for make_coverage_reports with an options object of old callers
+
+    Library users may pass their own options object, with only the options
+    that make_coverage_reports used to need.  The newer ones have defaults
+
+        >>> class opts:
+        ...     verbose = False
+        ...     strip_prefix = None
+        ...     path_alias = None
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.make_coverage_reports(inputDir, outputDir, opts)
+        >>> sorted(os.listdir(outputDir))  # doctest: +NORMALIZE_WHITESPACE
+        ['all.html', 'z3c.coverage.__init__.html',
+         'z3c.coverage.coveragediff.html', 'z3c.coverage.coveragereport.html',
+         'z3c.coverage.html', 'z3c.html']
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_external_stylesheet():
+    """Test for --external-stylesheet
+
+    Every page normally includes the styles.  They can be put into a
+    separate file instead, which all the pages link to
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--external-stylesheet'])
+
+        >>> with open(os.path.join(outputDir, 'coverage.css')) as f:
+        ...     print(f.read())  # doctest: +ELLIPSIS
+                a {text-decoration: none; display: block; padding-right: 1em;}
+        ...
+        >>> for filename in ['all.html', 'z3c.coverage.html']:
+        ...     with open(os.path.join(outputDir, filename)) as f:
+        ...         page = f.read()
+        ...     print('<style' in page, '<link rel="stylesheet" '
+        ...           'type="text/css" href="coverage.css" />' in page)
+        False True
+        False True
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_gzip():
+    r"""Test for --gzip and --gzip-only
+
+    A gzip-compressed copy of every file can be written as well, for web
+    servers that can serve it as it is
+
+        >>> import gzip
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--gzip', '--gzip-level=1'])
+        >>> sorted(os.listdir(outputDir))  # doctest: +NORMALIZE_WHITESPACE
+        ['all.html', 'all.html.gz', 'z3c.coverage.__init__.html',
+         'z3c.coverage.__init__.html.gz', 'z3c.coverage.coveragediff.html',
+         'z3c.coverage.coveragediff.html.gz',
+         'z3c.coverage.coveragereport.html',
+         'z3c.coverage.coveragereport.html.gz', 'z3c.coverage.html',
+         'z3c.coverage.html.gz', 'z3c.html', 'z3c.html.gz']
+
+        >>> with open(os.path.join(outputDir, 'z3c.html'), 'rb') as f:
+        ...     page = f.read()
+        >>> with gzip.open(os.path.join(outputDir, 'z3c.html.gz')) as f:
+        ...     f.read() == page
+        True
+
+    Or only the compressed files are written
+
+        >>> shutil.rmtree(outputDir)
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--gzip-only',
+        ...      '--external-stylesheet'])
+        >>> sorted(os.listdir(outputDir))  # doctest: +NORMALIZE_WHITESPACE
+        ['all.html.gz', 'coverage.css.gz', 'z3c.coverage.__init__.html.gz',
+         'z3c.coverage.coveragediff.html.gz',
+         'z3c.coverage.coveragereport.html.gz', 'z3c.coverage.html.gz',
+         'z3c.html.gz']
+
+    The time is left out of the compressed files, so that unchanged files
+    stay the same
+
+        >>> with open(os.path.join(outputDir, 'coverage.css.gz'), 'rb') as f:
+        ...     compressed = f.read()
+        >>> compressed[4:8] == b'\0\0\0\0'
+        True
+
+    The options only apply to the run they were given for
+
+        >>> coveragereport.GZIP is None, coveragereport.STYLESHEET is None
+        (True, True)
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_single_page_report():
+    """Test for --single-page
+
+    Instead of a page for every module and package, a single page can be
+    written, with the source code of the modules in separate files
+
+        >>> import json
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--single-page'])
+        >>> for dirpath, dirnames, filenames in sorted(os.walk(outputDir)):
+        ...     for filename in sorted(filenames):
+        ...         print(os.path.relpath(os.path.join(dirpath, filename),
+        ...                               outputDir).replace(os.sep, '/'))
+        coverage.css
+        index.html
+        source/z3c.coverage.__init__.html
+        source/z3c.coverage.coveragediff.html
+        source/z3c.coverage.coveragereport.html
+
+    The page contains an index of the tree with the coverage statistics
+
+        >>> with open(os.path.join(outputDir, 'index.html')) as f:
+        ...     page = f.read()
+        >>> start = page.index('<script type="application/json"')
+        >>> start = page.index('>', start) + 1
+        >>> index = json.loads(page[start:page.index('</script>', start)])
+        >>> index[:3], index[3][0][:3]
+        (['', 122, 361], ['z3c', 122, 361])
+        >>> for name, covered, total in sorted(index[3][0][3][0][3]):
+        ...     print(name, covered, total)
+        __init__ 1 1
+        coveragediff 86 164
+        coveragereport 35 196
+
+        >>> with open(os.path.join(outputDir, 'source',
+        ...                        'z3c.coverage.__init__.html')) as f:
+        ...     print(f.read())  # doctest: +ELLIPSIS
+        <html>
+          <head><link rel="stylesheet" ... href="../coverage.css" /></head>
+          <body>
+        <pre>    1: # Make a package.
+        </pre>
+          </body>
+        </html>
+        <BLANKLINE>
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_summary_format():
+    """Test for --format=json and --format=csv
+
+    Instead of HTML pages, only the coverage statistics can be written
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> coveragereport.main([inputDir, '--quiet', '--format=csv'])
+        name,type,covered,total,percent
+        everything,package,122,361,33
+        z3c,package,122,361,33
+        z3c.coverage,package,122,361,33
+        z3c.coverage.__init__,module,1,1,100
+        z3c.coverage.coveragediff,module,86,164,52
+        z3c.coverage.coveragereport,module,35,196,17
+
+    Messages go to standard error when the summary goes to standard output
+
+        >>> orig_stderr = sys.stderr
+        >>> sys.stderr = sys.stdout
+        >>> coveragereport.main([inputDir, '--format=csv'])
+        ... # doctest: +ELLIPSIS
+        Loading coverage reports from .../sampleinput
+        name,type,covered,total,percent
+        ...
+        Wrote CSV summary to -
+        >>> sys.stderr = orig_stderr
+
+    The summary can be written to a file
+
+        >>> import json
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputFile = os.path.join(tempDir, 'coverage.json')
+        >>> coveragereport.main(
+        ...     [inputDir, outputFile, '--quiet', '--format=json'])
+        >>> os.listdir(tempDir)
+        ['coverage.json']
+        >>> with open(outputFile) as f:
+        ...     summary = json.load(f)
+        >>> for record in summary[-2:]:
+        ...     print(record['name'], record['type'], record['covered'],
+        ...           record['total'], record['percent'])
+        z3c.coverage.coveragediff module 86 164 52
+        z3c.coverage.coveragereport module 35 196 17
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
 def doctest_get_svn_revision():
     """Test for get_svn_revision
 
@@ -247,6 +1087,119 @@ def doctest_get_svn_revision():
     """
 
 
+def doctest_get_revision():
+    """Test for get_revision
+
+    The revision of a git working tree is read from the .git directory,
+    without running git
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-revision-')
+        >>> def write(filename, text):
+        ...     filename = os.path.join(tempDir, filename)
+        ...     if not os.path.isdir(os.path.dirname(filename)):
+        ...         os.makedirs(os.path.dirname(filename))
+        ...     with open(filename, 'w') as f:
+        ...         f.write(text)
+        >>> commit = 'c0ffee' * 6 + 'f00d'
+        >>> write('repo/.git/HEAD', 'ref: refs/heads/master\\n')
+        >>> write('repo/.git/refs/heads/master', commit + '\\n')
+        >>> os.makedirs(os.path.join(tempDir, 'repo', 'src', 'pkg'))
+        >>> coveragereport.get_git_revision(
+        ...     os.path.join(tempDir, 'repo', 'src', 'pkg')) == commit
+        True
+
+    Refs can also be packed
+
+        >>> write('repo/.git/packed-refs',
+        ...       '# pack-refs with: peeled fully-peeled sorted\\n'
+        ...       + 'a' * 40 + ' refs/heads/feature\\n'
+        ...       + '^' + 'b' * 40 + '\\n')
+        >>> write('repo/.git/HEAD', 'ref: refs/heads/feature\\n')
+        >>> coveragereport.get_git_revision(
+        ...     os.path.join(tempDir, 'repo')) == 'a' * 40
+        True
+
+    and HEAD can be detached
+
+        >>> write('repo/.git/HEAD', commit + '\\n')
+        >>> coveragereport.get_git_revision(
+        ...     os.path.join(tempDir, 'repo')) == commit
+        True
+
+    A linked worktree has a .git file pointing to its git directory, which
+    shares the refs of the main one
+
+        >>> write('repo/.git/worktrees/wt/HEAD', 'ref: refs/heads/master\\n')
+        >>> write('repo/.git/worktrees/wt/commondir', '../..\\n')
+        >>> write('wt/.git', 'gitdir: ../repo/.git/worktrees/wt\\n')
+        >>> coveragereport.get_git_revision(
+        ...     os.path.join(tempDir, 'wt')) == commit
+        True
+
+    Other directories are not git working trees
+
+        >>> print(coveragereport.get_git_revision(tempDir))
+        None
+
+    The revisions of a Subversion working copy are read from its database
+
+        >>> import sqlite3
+        >>> os.makedirs(os.path.join(tempDir, 'wc', '.svn'))
+        >>> os.makedirs(os.path.join(tempDir, 'wc', 'trunk', 'src'))
+        >>> db = sqlite3.connect(os.path.join(tempDir, 'wc', '.svn', 'wc.db'))
+        >>> _ = db.execute('CREATE TABLE nodes (local_relpath TEXT,'
+        ...                ' op_depth INTEGER, revision INTEGER)')
+        >>> _ = db.executemany('INSERT INTO nodes VALUES (?, ?, ?)', [
+        ...     ('', 0, 4168), ('trunk', 0, 4172), ('trunk/src', 0, 4172),
+        ...     ('trunk/src', 1, None), ('trunks', 0, 4160)])
+        >>> db.commit()
+        >>> db.close()
+        >>> coveragereport.get_svn_wc_revision(os.path.join(tempDir, 'wc'))
+        '4160:4172'
+        >>> coveragereport.get_svn_wc_revision(
+        ...     os.path.join(tempDir, 'wc', 'trunk', 'src'))
+        '4172'
+        >>> print(coveragereport.get_svn_wc_revision(tempDir))
+        None
+
+    ``get_revision`` tries all of them, and remembers what it found
+
+        >>> path = os.path.join(tempDir, 'repo', 'src')
+        >>> coveragereport.get_revision(path) == commit
+        True
+        >>> write('repo/.git/HEAD', 'a' * 40 + '\\n')
+        >>> coveragereport.get_revision(path) == commit
+        True
+        >>> coveragereport.get_revision(tempDir)
+        'UNKNOWN'
+
+    The revision can be given explicitly, or in an environment variable
+
+        >>> coveragereport.get_revision(path, '1.0')
+        '1.0'
+        >>> os.environ[coveragereport.REVISION_ENV] = 'build-42'
+        >>> coveragereport.get_revision(path)
+        'build-42'
+        >>> del os.environ[coveragereport.REVISION_ENV]
+
+    The revision shows up in the footer of the report
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--highlighter=python',
+        ...      '--revision=1.0'])
+        >>> with open(os.path.join(outputDir, 'all.html')) as f:
+        ...     'Generated for revision 1.0 on' in f.read()
+        True
+
+        >>> coveragereport._revisions.clear()
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
 def doctest_syntax_highlight_with_enscript():
     """Test for syntax_highlight
 
@@ -299,6 +1252,288 @@ def doctest_syntax_highlight_without_enscript():
     """
 
 
+FAKE_ENSCRIPT = '''
+import os
+import sys
+filenames = sys.argv[2:]
+with open(sys.argv[1], 'a') as log:
+    log.write('%d files\\n' % len(filenames) if filenames else 'stdin\\n')
+# Like enscript with some options, this one can put all files in one <PRE>.
+one_pre = filenames and os.environ.get('FAKE_ENSCRIPT_ONE_PRE')
+print('<HTML><BODY>')
+if one_pre:
+    print('<PRE>')
+for filename in filenames or ['-']:
+    if filename == '-':
+        text = sys.stdin.read()
+    else:
+        with open(filename) as f:
+            text = f.read()
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if one_pre:
+        print('<B>%s</B>' % text)
+    else:
+        print('<H1>%s</H1>\\n<PRE>\\n<B>%s</B></PRE>\\n<HR>' % (
+            filename, text))
+if one_pre:
+    print('</PRE>')
+print('</BODY></HTML>')
+'''
+
+
+def doctest_enscript_highlight_many():
+    """Test for enscript_highlight_many
+
+    Many files can be highlighted with a single run of enscript.  We'll use a
+    fake enscript that logs how many files it was given each time it runs:
+
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> script = os.path.join(tempDir, 'enscript.py')
+        >>> log = os.path.join(tempDir, 'enscript.log')
+        >>> with open(script, 'w') as f:
+        ...     _ = f.write(FAKE_ENSCRIPT)
+        >>> command_orig = coveragereport.HIGHLIGHT_COMMAND
+        >>> coveragereport.HIGHLIGHT_COMMAND = [sys.executable, script, log]
+
+        >>> def print_log():
+        ...     with open(log) as f:
+        ...         print(''.join(sorted(f)).strip())
+        ...     os.unlink(log)
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> texts = []
+        >>> for filename in sorted(os.listdir(inputDir)):
+        ...     if filename.endswith('.cover'):
+        ...         with open(os.path.join(inputDir, filename)) as f:
+        ...             texts.append(f.read())
+
+    The output is split up into the highlighted code of every file, which
+    is the same as when the code is highlighted one file at a time.  A
+    single file is passed to enscript on its standard input
+
+        >>> htmls = coveragereport.enscript_highlight_many(texts)
+        >>> print_log()
+        4 files
+        >>> htmls == [coveragereport.enscript_highlight(text)
+        ...           for text in texts]
+        True
+        >>> print_log()
+        stdin
+        stdin
+        stdin
+        stdin
+        >>> print(htmls[0])
+        <BLANKLINE>
+        <B>    1: # Make a package.
+        </B>
+
+    The files are given to enscript with short names, relative to the
+    temporary directory it runs in
+
+        >>> with open(script, 'a') as f:
+        ...     _ = f.write('with open(sys.argv[1] + ".argv", "w") as f:\\n'
+        ...                 '    f.write(" ".join(filenames))\\n')
+        >>> coveragereport.enscript_highlight_many(texts) == htmls
+        True
+        >>> with open(log + '.argv') as f:
+        ...     print(f.read())
+        0 1 2 3
+        >>> with open(script, 'w') as f:
+        ...     _ = f.write(FAKE_ENSCRIPT)
+        >>> print_log()
+        4 files
+
+    If the output cannot be split up, because it does not have a <PRE>
+    element for every file, the files are highlighted one at a time, with a
+    warning
+
+        >>> os.environ['FAKE_ENSCRIPT_ONE_PRE'] = '1'
+        >>> stderr_orig, sys.stderr = sys.stderr, sys.stdout
+        >>> coveragereport.enscript_highlight_many(texts) == htmls
+        ... # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+        Warning: ... gave 1 HTML fragments for 4 files; highlighting them one
+        at a time
+        True
+        >>> sys.stderr = stderr_orig
+        >>> del os.environ['FAKE_ENSCRIPT_ONE_PRE']
+        >>> print_log()
+        4 files
+        stdin
+        stdin
+        stdin
+        stdin
+
+    When generating HTML files, batch highlighting can be requested.
+    The source code of all modules is then highlighted by a single run of
+    enscript
+
+        >>> filelist = list(coveragereport.get_file_list(
+        ...     inputDir, coveragereport.filter_fn))
+        >>> tree = coveragereport.create_tree_from_files(filelist, inputDir)
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> os.mkdir(outputDir)
+        >>> coveragereport.generate_htmls_from_tree(
+        ...     tree, inputDir, outputDir, batch_highlight=True)
+        >>> print_log()
+        3 files
+
+    With several worker processes, each of them runs enscript once
+
+        >>> tree = coveragereport.create_tree_from_files(filelist, inputDir)
+        >>> coveragereport.generate_htmls_from_tree(
+        ...     tree, inputDir, outputDir, jobs=2, batch_highlight=True)
+        >>> print_log()
+        2 files
+        stdin
+
+    Large batches are split up.  The limit is on the number of pages, some
+    of which (the packages) have no source code to highlight
+
+        >>> tree = coveragereport.create_tree_from_files(filelist, inputDir)
+        >>> with coveragereport.configured({'HIGHLIGHT_BATCH_SIZE': 2}):
+        ...     coveragereport.generate_htmls_from_tree(
+        ...         tree, inputDir, outputDir, batch_highlight=True)
+        >>> print_log()
+        2 files
+        stdin
+
+        >>> coveragereport.HIGHLIGHT_COMMAND = command_orig
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_HighlightCache():
+    """Test for HighlightCache
+
+    The cache keeps syntax-highlighted code in a directory
+
+        >>> from z3c.coverage.coveragereport import HighlightCache
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> cacheDir = os.path.join(tempDir, 'cache')
+        >>> cache = HighlightCache(cacheDir, max_size=15)
+
+    Entries are keyed by the annotated source code, the highlighter and its
+    version
+
+        >>> key = cache.highlight_key(b'    1: pass', 'python')
+        >>> key == cache.highlight_key(b'    1: pass', 'python')
+        True
+        >>> key == cache.highlight_key(b'>>>>>> pass', 'python')
+        False
+        >>> key == cache.highlight_key(b'    1: pass', 'enscript')
+        False
+
+        >>> cache_version_orig = coveragereport.PYTHON_HIGHLIGHTER_VERSION
+        >>> coveragereport.PYTHON_HIGHLIGHTER_VERSION = 'new'
+        >>> key == cache.highlight_key(b'    1: pass', 'python')
+        False
+        >>> coveragereport.PYTHON_HIGHLIGHTER_VERSION = cache_version_orig
+
+        >>> print(cache.get(key))
+        None
+        >>> cache.set(key, u'<B>pass</B>')
+        >>> print(cache.get(key))
+        <B>pass</B>
+
+    ``prune`` removes the least recently used entries when the cache gets
+    bigger than ``max_size`` bytes
+
+        >>> def age(key, seconds):
+        ...     filename = os.path.join(cacheDir, key[:2], key[2:])
+        ...     mtime = os.stat(filename).st_mtime
+        ...     os.utime(filename, (mtime - seconds, mtime - seconds))
+
+        >>> key2 = cache.highlight_key(b'    2: pass', 'python')
+        >>> cache.set(key2, u'two')
+        >>> age(key, 100)
+        >>> age(key2, 200)
+        >>> cache.prune()
+        >>> print(cache.get(key))
+        <B>pass</B>
+        >>> print(cache.get(key2))
+        two
+
+        >>> key3 = cache.highlight_key(b'    3: pass', 'python')
+        >>> cache.set(key3, u'three')
+        >>> age(key3, 300)
+
+    Getting an entry counts as using it, so here the first entry is the
+    least recently used one
+
+        >>> age(key, 400)
+        >>> age(key2, 500)
+        >>> print(cache.get(key2))
+        two
+        >>> cache.prune()
+        >>> print(cache.get(key))
+        None
+        >>> print(cache.get(key2))
+        two
+        >>> print(cache.get(key3))
+        three
+
+    syntax_highlight() uses the cache, and only runs the highlighter for
+    code it has not seen before
+
+        >>> def counting_highlight(text):
+        ...     print('highlighting %s' % text.splitlines()[0].strip())
+        ...     return coveragereport.highlight_cover_text(text)
+        >>> coveragereport.HIGHLIGHTERS['counting'] = counting_highlight
+        >>> settings = {'HIGHLIGHT_CACHE': HighlightCache(cacheDir)}
+
+        >>> filename = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput',
+        ...     'z3c.coverage.__init__.cover')
+        >>> with coveragereport.configured(settings):
+        ...     text = syntax_highlight(filename, 'counting')
+        highlighting 1: # Make a package.
+        >>> with coveragereport.configured(settings):
+        ...     syntax_highlight(filename, 'counting') == text
+        True
+
+        >>> del coveragereport.HIGHLIGHTERS['counting']
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
+def doctest_syntax_highlight_with_python():
+    """Test for syntax_highlight
+
+    There is also a syntax highlighter written in Python, which does not
+    need any external programs.  Its output looks like that of enscript.
+    It expects a .cover file, and leaves the coverage information at the
+    start of every line alone, so that highlight_uncovered_lines() can find
+    the uncovered lines:
+
+        >>> filename = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput',
+        ...     'z3c.coverage.coveragediff.cover')
+        >>> output = syntax_highlight(filename, 'python')
+        >>> print(output)  # doctest: +ELLIPSIS
+               <I><FONT COLOR="#B22222">#!/usr/bin/env python</FONT></I>
+        ...
+            1: <B><FONT COLOR="#A020F0">try</FONT></B>:
+            1:     any
+        &gt;&gt;&gt;&gt;&gt;&gt; <B><FONT ...>except</FONT></B> NameError:...
+        ...
+
+        >>> ('<div class="notcovered">&gt;&gt;&gt;&gt;&gt;&gt; '
+        ...  '<B><FONT COLOR="#A020F0">except</FONT></B> NameError:</div>'
+        ...  in highlight_uncovered_lines(output))
+        True
+
+    The highlighter used by default can be changed
+
+        >>> with coveragereport.configured({'HIGHLIGHTER': 'python'}):
+        ...     syntax_highlight(filename) == output
+        True
+
+    """
+
+
 def doctest_main_default_arguments():
     """Test for main()
 
@@ -336,6 +1571,81 @@ def doctest_main_default_arguments():
     """
 
 
+def doctest_timings():
+    r"""Test for --slowest and --profile-out
+
+    The time spent in every phase of the run, and on the slowest pages, can
+    be printed.  The two biggest modules are the slowest, in either order
+
+        >>> inputDir = os.path.join(
+        ...     os.path.dirname(z3c.coverage.__file__), 'sampleinput')
+        >>> tempDir = tempfile.mkdtemp(prefix='tmp-z3c.coverage-report-')
+        >>> outputDir = os.path.join(tempDir, 'report')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--highlighter=python',
+        ...      '--slowest=2'])  # doctest: +ELLIPSIS
+        Time spent in every phase:
+          ...
+        Slowest pages:
+          ... s  z3c.coverage.coverage...
+          ... s  z3c.coverage.coverage...
+
+    or saved as JSON
+
+        >>> profile = os.path.join(tempDir, 'profile.json')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--highlighter=python',
+        ...      '--profile-out', profile])
+        >>> import json
+        >>> with open(profile) as f:
+        ...     data = json.load(f)
+        >>> sorted(data['phases'])
+        ['highlighting', 'rendering', 'tree', 'writing']
+        >>> sorted(page['name'] for page in data['slowest_pages'][:2])
+        ['z3c.coverage.coveragediff', 'z3c.coverage.coveragereport']
+
+    Other file names get cProfile statistics
+
+        >>> import pstats
+        >>> profile = os.path.join(tempDir, 'report.prof')
+        >>> coveragereport.main(
+        ...     [inputDir, outputDir, '--quiet', '--profile-out', profile])
+        >>> stats = pstats.Stats(profile)
+        >>> coveragereport.TIMINGS is None
+        True
+
+    Library users can pass their own Timings instance in the options, and
+    extend it to get the timings as they come in
+
+        >>> pages = []
+        >>> class PageTimings(coveragereport.Timings):
+        ...     def add_page(self, name, seconds):
+        ...         super(PageTimings, self).add_page(name, seconds)
+        ...         pages.append(name)
+        >>> class opts(object):
+        ...     verbose = False
+        ...     strip_prefix = None
+        ...     path_alias = None
+        ...     highlighter = 'python'
+        ...     timings = PageTimings()
+        >>> coveragereport.make_coverage_reports(inputDir, outputDir, opts)
+        >>> for name in sorted(pages):
+        ...     print(name)
+        z3c
+        z3c.coverage
+        z3c.coverage.__init__
+        z3c.coverage.coveragediff
+        z3c.coverage.coveragereport
+        >>> sorted(opts.timings.phases)
+        ['highlighting', 'rendering', 'tree', 'writing']
+        >>> coveragereport.TIMINGS is None
+        True
+
+        >>> shutil.rmtree(tempDir)
+
+    """
+
+
 def setUp(test):
     test.globs['print_function'] = print_function
 
@@ -359,6 +1669,8 @@ def test_suite():
             optionflags=doctest.NORMALIZE_WHITESPACE | doctest.ELLIPSIS,
             ),
         doctest.DocTestSuite(checker=checker),
+        doctest.DocTestSuite(
+            'z3c.coverage.coverfile'),
         doctest.DocTestSuite(
             'z3c.coverage.coveragediff'),
         doctest.DocTestSuite(